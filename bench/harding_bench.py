@@ -0,0 +1,76 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(os.path.join(q[0], "src"))
+del p, q # keep globals clean
+
+import time
+import numpy as np
+
+import harding as hd
+import utility as u
+
+def legacy_lcdf(self, times):
+    """Pure-Python triple loop Harding recurrence, kept as the baseline."""
+    mode = int(self.max_score / 2)
+    cf = np.ones(mode + 1, dtype='float')
+
+    size = map(int,sorted(times))
+    k = len(times)
+
+    N = [size[-1]]
+    if k > 2:
+        for i in range(k-2,0,-1):
+            N.append(size[i] + N[-1])
+    N.reverse()
+
+    for i in range(k-1):
+        m = size[i]
+        n = N[i]
+
+        if n < mode:
+            p = min(m + n, mode)
+            factor = np.sign(p - (n+1)) or -1
+            for t in range(n+1, p+factor, factor):
+                for u in range(mode, t-1, -1):
+                    cf[u] = cf[u] - cf[u-t]
+
+        q = int(min(m, mode))
+        for s in range(1,q+1):
+            for u in range(s, mode+1):
+                cf[u] = cf[u] + cf[u-s]
+    return cf
+
+class LegacyDistribution(hd.HardingDistribution):
+    _build_lcdf = legacy_lcdf
+
+def timed(cls, times):
+    start = time.time()
+    distribution = cls(times)
+    return time.time() - start, distribution.cdf
+
+def main(designs):
+    print "#\tsamples\tmax_score\tlegacy(s)\tvectorized(s)\tspeedup\tmax_rel_err"
+    for timepoints,reps in designs:
+        times = u.make_times(timepoints, reps)
+        t_old, cdf_old = timed(LegacyDistribution, times)
+        t_new, cdf_new = timed(hd.HardingDistribution, times)
+
+        finite = np.isfinite(cdf_old) & (cdf_old > 0)
+        if np.any(finite):
+            err = np.max(np.abs(cdf_new[finite] - cdf_old[finite])
+                         / cdf_old[finite])
+            err = "%.2e" % err
+        else:
+            err = "overflow" # legacy counts exceed float range.
+        print "%dx%d\t%d\t%d\t%.4f\t%.4f\t%.1f\t%s" % (
+            timepoints, reps, int(np.sum(times)), int((len(cdf_new)-1)/2),
+            t_old, t_new, t_old / max(t_new, 1e-9), err)
+
+if __name__ == "__main__":
+    main([(12, 1), (12, 2), (24, 2), (12, 4), (24, 3), (48, 2), (48, 4),
+          (96, 3)])
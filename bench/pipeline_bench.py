@@ -0,0 +1,230 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(q[0])
+sys.path.append(os.path.join(q[0], "src"))
+ROOT = q[0]
+del p, q # keep globals clean
+
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+import run_JTKCYCLE as jtk
+from parsed import DataParser
+from harding import HardingDistribution
+from main import JTKCycleRun
+import utility as u
+import statistic
+
+STAGES = ["parse", "harding", "library", "run", "write"]
+
+def generate(f, genes, timepoints, reps, **kwargs):
+    """Writes a synthetic ZT-headed table: a fraction of rows carry the
+       waveform at a random period and phase, every row carries noise."""
+    interval = kwargs.get("interval", 2)
+    waveform = kwargs.get("waveform", "cosine")
+    width = kwargs.get("width", 0.75)
+    rhythmic = kwargs.get("rhythmic", 0.5)
+    noise = kwargs.get("noise", 0.5)
+    periods = kwargs.get("periods", [20, 22, 24, 26])
+    rng = np.random.RandomState(kwargs.get("seed", 0))
+
+    times = np.repeat(interval * np.arange(timepoints), reps)
+    function = jtk.__get_function__(waveform, width * np.pi * 2)
+
+    f.write("#" + "".join(["\tSampZT%g" % t for t in times]) + "\n")
+    for i in xrange(genes):
+        values = noise * rng.standard_normal(len(times))
+        if rng.random_sample() < rhythmic:
+            period = periods[rng.randint(len(periods))]
+            phase = rng.uniform(0, period)
+            angles = 2 * np.pi * (times - phase) / period
+            values += np.array(function(angles), dtype='float')
+        f.write("gene%d\t" % i + "\t".join(["%.4f" % v for v in values])
+                + "\n")
+
+def timed(fn, *args):
+    start = time.time()
+    value = fn(*args)
+    return time.time() - start, value
+
+def parse(path):
+    with open(path) as f:
+        parser = DataParser(f, True)
+        rows = list(parser.generate_series())
+    return parser, rows
+
+def build_library(test):
+    for cycle in test.generate_jtk_cycles():
+        for reference in cycle.generate_references():
+            if not cycle.sorted:
+                cycle.tau_vector(reference)
+    test.generate_reference_matrix()
+    test.generate_unique_matrix()
+
+def run(test, rows, batch):
+    if batch:
+        names = [name for name,_ in rows]
+        bests, results = [], []
+        for lo in xrange(0, len(rows), batch):
+            block = [series for _,series in rows[lo:lo+batch]]
+            b, r = test.run_matrix(block)
+            bests.extend(b)
+            results.extend(r)
+        return zip(names, bests, results)
+
+    out = []
+    for name,series in rows:
+        best = test.run(series)
+        out.append((name, best, test.results))
+    return out
+
+def write(path, periods, outputs, summary):
+    with open(path, "w") as f:
+        jtk.__write_header__(f, periods, summary)
+        for name,best,results in outputs:
+            jtk.__write_result__(f, name, best, results, summary)
+
+def bench(args):
+    """Times every stage over a synthetic design, keeping the fastest of
+       the repeats. Each repeat starts from cold memoization caches."""
+    workdir = tempfile.mkdtemp(prefix="jtk_bench")
+    table = os.path.join(workdir, "table.txt")
+    output = os.path.join(workdir, "output.txt")
+    with open(table, "w") as f:
+        generate(f, args.genes, args.timepoints, args.reps,
+                 waveform=args.waveform, width=args.width, noise=args.noise,
+                 rhythmic=args.rhythmic, periods=args.periods,
+                 seed=args.seed)
+
+    function = jtk.__get_function__(args.waveform, args.width * np.pi * 2)
+    best = dict((stage, float("inf")) for stage in STAGES)
+    for i in xrange(args.repeat):
+        t, (parser, rows) = timed(parse, table)
+        best["parse"] = min(best["parse"], t)
+
+        times = u.make_times(len(parser.timepoints), parser.reps)
+        t, _ = timed(HardingDistribution, times)
+        best["harding"] = min(best["harding"], t)
+
+        make = lambda: JTKCycleRun(parser.reps, parser.timepoints,
+                                   args.periods, args.offset_step,
+                                   function=function,
+                                   threshold=args.threshold)
+        test = make()
+        t, _ = timed(build_library, test)
+        best["library"] = min(best["library"], t)
+
+        test = make()
+        build_library(test)
+        t, outputs = timed(run, test, rows, args.batch)
+        best["run"] = min(best["run"], t)
+
+        t, _ = timed(write, output, args.periods, outputs, args.summary)
+        best["write"] = min(best["write"], t)
+
+    for path in (table, output):
+        os.remove(path)
+    os.rmdir(workdir)
+
+    design = dict((key, getattr(args, key)) for key in
+                  ["genes", "timepoints", "reps", "waveform", "width",
+                   "noise", "rhythmic", "seed", "periods", "offset_step",
+                   "threshold", "batch", "summary"])
+    per_gene = dict((stage, best[stage] / max(args.genes, 1))
+                    for stage in ["parse", "run", "write"])
+    return {
+        "version": jtk.VERSION,
+        "design": design,
+        "stages": best,
+        "per_gene": per_gene,
+        }
+
+def compare(report, baseline, tolerance, min_delta=0.0):
+    """Prints current against baseline stage times. Returns the stages
+       that slowed down by more than the tolerated fraction, ignoring
+       differences below min_delta seconds as timer noise."""
+    if baseline["design"] != report["design"]:
+        print "# warning: baseline was measured on a different design."
+
+    slower = []
+    print "#\tbaseline(s)\tcurrent(s)\tratio\tstatus"
+    for stage in STAGES:
+        old = baseline["stages"].get(stage)
+        new = report["stages"][stage]
+        if old is None:
+            print "%s\t-\t%.4f\t-\tnew" % (stage, new)
+            continue
+        ratio = new / max(old, 1e-9)
+        status = "ok"
+        if ratio > 1 + tolerance and new - old > min_delta:
+            status = "REGRESSION"
+            slower.append(stage)
+        print "%s\t%.4f\t%.4f\t%.2f\t%s" % (stage, old, new, ratio, status)
+    return slower
+
+def __create_parser__():
+    p = argparse.ArgumentParser(
+        description="time each JTK_CYCLE pipeline stage on synthetic data"
+        )
+    p.add_argument("--genes", type=int, default=1000)
+    p.add_argument("--timepoints", type=int, default=12)
+    p.add_argument("--reps", type=int, default=2)
+    p.add_argument("--waveform", default="cosine",
+                   choices=["cosine","rampup","rampdown","step","impulse"])
+    p.add_argument("--width", type=float, default=0.75)
+    p.add_argument("--noise", type=float, default=0.5,
+                   help="standard deviation of the added noise")
+    p.add_argument("--rhythmic", type=float, default=0.5,
+                   help="fraction of rows carrying the waveform")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--periods", type=json.loads, default=[20,22,24,26],
+                   help="JSON array of search periods")
+    p.add_argument("--offset-step", dest="offset_step", type=float)
+    p.add_argument("--sort-threshold", dest="threshold", type=int,
+                   default=statistic.SORTED_THRESHOLD)
+    p.add_argument("-b", "--batch", type=int, default=0,
+                   help="run through the matrix engine in blocks of N")
+    p.add_argument("-s", "--summary", action='store_true', default=False)
+    p.add_argument("--repeat", type=int, default=3,
+                   help="keep the fastest of N repeats (dflt: 3)")
+    p.add_argument("-o", "--output",
+                   default=os.path.join(ROOT, "bench_output.txt"),
+                   help="JSON results file (dflt: bench_output.txt)")
+    p.add_argument("--baseline",
+                   help="JSON results of an earlier run to compare against")
+    p.add_argument("--tolerance", type=float, default=0.25,
+                   help="flag stages slower than baseline by this fraction")
+    p.add_argument("--min-delta", dest="min_delta", type=float, default=0.01,
+                   help="ignore slowdowns below this many seconds")
+    return p
+
+def main(args):
+    report = bench(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+    if args.baseline is None:
+        print "#\tseconds\tper_gene"
+        for stage in STAGES:
+            per_gene = report["per_gene"].get(stage)
+            print "%s\t%.4f\t%s" % (stage, report["stages"][stage],
+                                    "-" if per_gene is None
+                                    else "%.2e" % per_gene)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    slower = compare(report, baseline, args.tolerance, args.min_delta)
+    return 1 if slower else 0
+
+if __name__ == "__main__":
+    sys.exit(main(__create_parser__().parse_args()))
@@ -0,0 +1,102 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(os.path.join(q[0], "src"))
+del p, q # keep globals clean
+
+import json
+import time
+import argparse
+import numpy as np
+
+from main import JTKCycleRun
+import statistic
+
+def measure(n, threshold, batch, rows, periods, seed=0):
+    """Milliseconds per row scoring n-sample series through JTKCycleRun,
+       row by row and in one matrix block, with the given threshold."""
+    reps = 2 * np.ones(n // 2)
+    timepoints = 2 * np.arange(n // 2)
+    rng = np.random.RandomState(seed)
+    X = rng.random_sample((max(rows, batch), 2 * (n // 2)))
+
+    test = JTKCycleRun(reps, timepoints, periods, 2, distribution="normal",
+                       threshold=threshold)
+    test.run_matrix(X[:2]) # build references and tables outside timing.
+    test.run(X[0])
+
+    start = time.time()
+    for series in X[:rows]:
+        test.run(series)
+    serial = (time.time() - start) / rows * 1000
+
+    start = time.time()
+    test.run_matrix(X[:batch])
+    batched = (time.time() - start) / batch * 1000
+    return {"serial": serial, "batch": batched}
+
+def bench(args):
+    """Times the int8 tau and sorted paths at every size. Returns the
+       report and the sizes at which the default threshold picks a path
+       slower than the other by more than the tolerated fraction."""
+    report, wrong = {}, []
+    for n in args.sizes:
+        tau = measure(n, sys.maxint, args.batch, args.rows, args.periods)
+        ranked = measure(n, 0, args.batch, args.rows, args.periods)
+        report[n] = {"tau": tau, "sorted": ranked}
+
+        chosen, other = (ranked, tau) if n > args.threshold else (tau, ranked)
+        for mode in ["serial", "batch"]:
+            if chosen[mode] > other[mode] * (1 + args.tolerance):
+                wrong.append((n, mode))
+    return report, wrong
+
+def __create_parser__():
+    threshold = statistic.SORTED_THRESHOLD
+    p = argparse.ArgumentParser(
+        description="check the sorting threshold against measured scoring "
+                    "times of the int8 tau and sorted paths"
+        )
+    p.add_argument("--sizes", type=json.loads,
+                   default=[threshold // 4, threshold // 2, threshold],
+                   help="JSON array of series lengths to time")
+    p.add_argument("--sort-threshold", dest="threshold", type=int,
+                   default=threshold,
+                   help="threshold to check (dflt: %d)" % threshold)
+    p.add_argument("--periods", type=json.loads, default=[20,22,24,26],
+                   help="JSON array of search periods")
+    p.add_argument("--rows", type=int, default=8,
+                   help="series scored row by row (dflt: 8)")
+    p.add_argument("-b", "--batch", type=int, default=64,
+                   help="series scored in one block (dflt: 64)")
+    p.add_argument("--tolerance", type=float, default=0.25,
+                   help="flag paths slower than the other by this fraction")
+    p.add_argument("-o", "--output",
+                   help="JSON results file (dflt: none)")
+    return p
+
+def main(args):
+    report, wrong = bench(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    print "#\ttau serial\tsorted serial\ttau batch\tsorted batch\tpath"
+    for n in args.sizes:
+        tau, ranked = report[n]["tau"], report[n]["sorted"]
+        path = "sorted" if n > args.threshold else "tau"
+        print "%d\t%.2f\t%.2f\t%.2f\t%.2f\t%s" % (
+            n, tau["serial"], ranked["serial"],
+            tau["batch"], ranked["batch"], path)
+    for n,mode in wrong:
+        print "# threshold %d picks the slower path at n=%d (%s)" % (
+            args.threshold, n, mode)
+    return 1 if wrong else 0
+
+if __name__ == "__main__":
+    sys.exit(main(__create_parser__().parse_args()))
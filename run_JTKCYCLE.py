@@ -11,9 +11,22 @@ import json
 import unittest
 import string
 import argparse
+import multiprocessing
+import StringIO
+import zipfile
+import collections
+import tempfile
 
 from main import JTKCycleRun
-from parsed import DataParser
+from parsed import DataParser, BundleParser, convert_bundle
+from cache import DistributionCache
+from profiler import Profiler
+from pipeline import run_pipeline
+from checkpoint import Checkpoint
+import shard as sh
+import fdr
+import library as lib
+import statistic
 
 import waveforms as w
 import numpy as np
@@ -30,7 +43,26 @@ def main(args): # argument namespace
     foutput = args.ofile
     fconfig = args.cfile
 
-    parser = DataParser(finput, args.repattern)
+    # output is opened for appending, so a resumed run keeps its rows.
+    if not args.resume and os.path.isfile(foutput.name):
+        foutput.truncate(0)
+
+    final = None
+    if args.fdr:
+        # q-values need every p-value: results go to a scratch file first.
+        final, foutput = foutput, tempfile.TemporaryFile()
+
+    bundle = None
+    if finput is not sys.stdin and zipfile.is_zipfile(finput.name):
+        bundle = finput.name
+        parser = BundleParser(bundle)
+    else:
+        parser = DataParser(finput, args.repattern)
+
+    span = None
+    if args.shard:
+        span = parser.shard(*args.shard)
+        sh.clear_manifest(foutput.name)
 
     max_period = (args.max or 26) + 1
     min_period = args.min or 20
@@ -50,7 +82,6 @@ def main(args): # argument namespace
     periods    = config.get("periods",     None) or periods
     density    = config.get("offset_step", None) or args.offset_step
 
-    function = __get_function__(args.function, args.width * np.pi * 2)
     symmetry = (args.function != "cosine") or args.symmetry
 
     if args.normal:
@@ -58,24 +89,125 @@ def main(args): # argument namespace
     else:
         distribution = "harding"
 
-    test = JTKCycleRun(
-        reps,
-        timepoints,
-        periods,
-        density,
-        distribution=distribution,
-        function=function,
-        symmetry=symmetry
-        )
+    # picklable description of the test, so workers can rebuild it.
+    settings = {
+        "reps": reps,
+        "timepoints": timepoints,
+        "periods": periods,
+        "density": density,
+        "distribution": distribution,
+        "function": args.function,
+        "width": args.width,
+        "symmetry": symmetry,
+        "threshold": args.threshold,
+        "cache": args.cache,
+        "cache_size": args.cache_size,
+        "library": args.library,
+        "bundle": bundle,
+        "prune": args.prune,
+        "memo": args.memo,
+        "cutoff": args.pvalue if args.significant else None,
+        }
+
+    if args.build_library:
+        test = __build_test__(settings)
+        library = lib.build_library(test, __library_key__(settings))
+        library.save(args.build_library)
+        finput.close()
+        foutput.close()
+        if fconfig != None:
+            fconfig.close()
+        return
 
+    profiler = None
+    if args.profile_report:
+        profiler = Profiler()
+
+    rows = 0
     summary = args.summary
-    __write_header__(foutput, periods, summary)
-    for name,series in parser.generate_series():
-        _,_,_,_,_ = test.run(series)
-        __write_data__(foutput, name, test, summary)
+    checkpoint = None
+    if args.checkpoint:
+        key = __checkpoint_key__(settings, summary)
+        key["repattern"] = args.repattern
+        key["input"] = __input_key__(finput, parser)
+        if args.shard:
+            key["shard"] = list(args.shard)
+        checkpoint = Checkpoint(args.checkpoint, key, args.checkpoint_every)
+    state = checkpoint.load() if args.resume else None
+    if state is not None:
+        foutput.seek(0, os.SEEK_END)
+        if foutput.tell() < state["output"]:
+            raise ValueError("output is shorter than its checkpoint.")
+        foutput.truncate(state["output"])
+        parser.seek(state["offset"])
+        rows = state["rows"]
+    else:
+        if args.resume and os.path.isfile(foutput.name):
+            foutput.truncate(0) # nothing recorded yet: start over.
+        __write_header__(foutput, periods, summary)
+    start = rows
+
+    # checkpoints are taken between blocks, so blocks must not be longer
+    # than the checkpoint cadence.
+    limit = args.checkpoint_every if checkpoint is not None else None
+
+    if args.pipeline:
+        size = args.batch or 256
+        rows = __run_pipeline__(foutput, parser, settings, args.workers, size,
+                                summary, args.queue_depth, profiler)
+    elif args.workers:
+        if args.cache:
+            __build_test__(settings) # warm the cache once for all workers.
+        size = min(args.batch or 256, limit or sys.maxint)
+        rows = __run_parallel__(foutput, parser, settings, args.workers, size,
+                                summary, checkpoint, rows)
+    elif args.batch:
+        test = __build_test__(settings, profiler)
+        size = min(args.batch, limit or sys.maxint)
+        for names,block in parser.generate_blocks(size):
+            foutput.write(__format_block__(test, names, block, summary))
+            rows += len(names)
+            if checkpoint is not None:
+                checkpoint.update(foutput, parser.offset, rows)
+        if args.memo:
+            __write_memo__(test)
+    else:
+        test = __build_test__(settings, profiler)
+        size = min(parser.block_size, limit or sys.maxint)
+        for names,block in parser.generate_blocks(size):
+            for name,series in zip(names, block):
+                _,_,_,_,p_value = test.run(series)
+                if test.passes(p_value):
+                    __write_data__(foutput, name, test, summary)
+                rows += 1
+            if checkpoint is not None:
+                checkpoint.update(foutput, parser.offset, rows)
+        if args.prune:
+            sys.stderr.write("pruned %d of %d references (%d unique scores)\n"
+                             % (test.pruned, test.visited, test.scored))
+        if args.memo:
+            __write_memo__(test)
+
+    if checkpoint is not None:
+        checkpoint.update(foutput, parser.offset, rows, force=True)
+
+    if args.shard:
+        if bundle:
+            total = parser.values.shape[0]
+        else:
+            total = os.fstat(finput.fileno()).st_size
+        foutput.flush()
+        sh.write_manifest(foutput.name, args.shard[0], args.shard[1],
+                          span, total, rows)
+
+    if final is not None:
+        foutput.seek(0)
+        fdr.append_qvalues(foutput, final, args.fdr_memory * 2**20)
+        foutput.close()
+        foutput = final
 
-    # Variables are not currently used...
-    p = args.pvalue
+    if profiler is not None:
+        __write_profile__(args.profile_report, profiler, rows - start)
 
     finput.close()
     foutput.close()
@@ -84,30 +216,194 @@ def main(args): # argument namespace
 
     return
 
+def __build_test__(settings, profiler=None):
+    """Builds the JTKCycleRun described by a picklable settings dict,
+       optionally instrumented by a profiler."""
+    function = __get_function__(settings["function"],
+                                settings["width"] * np.pi * 2)
+    cache = None
+    if settings["cache"]:
+        cache = DistributionCache(settings["cache"],
+                                  settings["cache_size"] * 2**20)
+    library = None
+    if settings["library"]:
+        library = lib.load_library(settings["library"])
+        library.check(__library_key__(settings))
+
+    test = JTKCycleRun(
+        settings["reps"],
+        settings["timepoints"],
+        settings["periods"],
+        settings["density"],
+        distribution=settings["distribution"],
+        function=function,
+        symmetry=settings["symmetry"],
+        threshold=settings["threshold"],
+        cache=cache,
+        library=library,
+        prune=settings.get("prune", False),
+        memo=settings.get("memo", 0),
+        cutoff=settings.get("cutoff", None),
+        profiler=profiler
+        )
+    return test
+
+def __library_key__(settings):
+    """Describes everything a reference library's contents depend on."""
+    floats = lambda xs: [float(x) for x in xs]
+    key = {
+        "reps": floats(settings["reps"]),
+        "timepoints": floats(settings["timepoints"]),
+        "periods": floats(settings["periods"]),
+        "density": settings["density"],
+        "function": settings["function"],
+        "width": settings["width"],
+        "symmetry": settings["symmetry"],
+        "sorted": sum(settings["reps"]) > settings["threshold"],
+        }
+    return key
+
+def __checkpoint_key__(settings, summary=False):
+    """Describes everything a checkpointed run's output depends on."""
+    key = __library_key__(settings)
+    key["distribution"] = settings["distribution"]
+    key["summary"] = summary
+    key["cutoff"] = settings["cutoff"]
+    if key["density"] is not None:
+        key["density"] = float(key["density"])
+    return key
+
+def __input_key__(finput, parser):
+    """Identifies a checkpointed run's input by its size and header, so a
+       run is not resumed against another file."""
+    return {
+        "size": os.fstat(finput.fileno()).st_size,
+        "header": parser.header,
+        }
+
+def __format_block__(test, names, block, summary=False):
+    """Runs a block of series through the matrix engine, returning the
+       formatted output text for every row in order that passes the
+       significance cutoff, if any."""
+    buf = StringIO.StringIO()
+    bests, results = test.run_matrix(block)
+    for name,best,result in zip(names, bests, results):
+        if test.passes(best[-1]):
+            __write_result__(buf, name, best, result, summary)
+    return buf.getvalue()
+
+#
+# process pool utilities
+#
+
+WORKER = {}
+
+def __run_parallel__(foutput, parser, settings, workers, size, summary=False,
+                     checkpoint=None, rows=0):
+    """Fans blocks of rows out to a process pool. Ordered imap hands the
+       formatted blocks back in input order, so output matches a serial
+       run byte for byte. Returns the count of rows written, from rows."""
+    pool = multiprocessing.Pool(workers, __init_worker__, (settings, summary))
+    ends = collections.deque() # (input offset, rows) past each block.
+    def blocks():
+        if settings["bundle"]:
+            # workers slice the memory-mapped bundle themselves.
+            for block in parser.generate_ranges(size):
+                ends.append((None, block[1] - block[0]))
+                yield block
+            return
+        for block in parser.generate_blocks(size):
+            ends.append((parser.offset, len(block[0])))
+            yield block
+
+    try:
+        for text in pool.imap(__run_block__, blocks()):
+            foutput.write(text)
+            offset, count = ends.popleft()
+            rows += count
+            if checkpoint is not None:
+                checkpoint.update(foutput, offset, rows)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return rows
+
+def __run_pipeline__(foutput, parser, settings, workers, size,
+                     summary=False, depth=8, profiler=None):
+    """Overlaps reading, scoring and writing: a reader thread parses
+       blocks, which are scored in process (or on a pool of N workers) and
+       written in order by a writer thread. Returns the number of rows."""
+    rows = [0]
+    if workers:
+        if settings["cache"]:
+            __build_test__(settings) # warm the cache once for all workers.
+        pool = multiprocessing.Pool(workers, __init_worker__,
+                                    (settings, summary))
+        def submit(block):
+            if settings["bundle"]:
+                rows[0] += block[1] - block[0]
+            else:
+                rows[0] += len(block[0])
+            return pool.apply_async(__run_block__, (block,))
+    else:
+        test = __build_test__(settings, profiler)
+        def submit(block):
+            names, series = block
+            rows[0] += len(names)
+            return __format_block__(test, names, series, summary)
+
+    if workers and settings["bundle"]:
+        blocks = parser.generate_ranges(size)
+    else:
+        blocks = parser.generate_blocks(size)
+
+    try:
+        run_pipeline(blocks, submit, foutput.write, depth)
+        if workers:
+            pool.close()
+    except:
+        if workers:
+            pool.terminate()
+        raise
+    finally:
+        if workers:
+            pool.join()
+    if settings["memo"] and not workers:
+        __write_memo__(test)
+    return rows[0]
+
+def __init_worker__(settings, summary):
+    """Pool initializer: builds the null distribution and reference library
+       once per worker process."""
+    test = __build_test__(settings)
+    test.generate_reference_matrix()
+    WORKER["test"] = test
+    WORKER["summary"] = summary
+    if settings["bundle"]:
+        WORKER["bundle"] = BundleParser(settings["bundle"])
+
+def __run_block__(block):
+    if "bundle" in WORKER:
+        names, series = WORKER["bundle"].block(*block)
+    else:
+        names, series = block
+    return __format_block__(WORKER["test"], names, series, WORKER["summary"])
+
 def __get_function__(astr, width):
     f = np.cos
     if astr == "cosine":
         f = np.cos
     elif astr == "rampup":
-        f = np.frompyfunc(
-            lambda x: w.ramp_up(x, width),
-            1, 1
-            )
+        f = lambda x: w.ramp_up(x, width)
     elif astr == "rampdown":
-        f = np.frompyfunc(
-            lambda x: w.ramp_down(x, width),
-            1, 1
-            )
+        f = lambda x: w.ramp_down(x, width)
     elif astr == "impulse":
-        f = np.frompyfunc(
-            lambda x: w.impulse(x, width),
-            1, 1
-            )
+        f = lambda x: w.impulse(x, width)
     elif astr == "step":
-        f = np.frompyfunc(
-            lambda x: w.step(x, width),
-            1, 1
-            )
+        f = lambda x: w.step(x, width)
     else:
         f = np.cos
     return f
@@ -116,6 +412,24 @@ def __get_function__(astr, width):
 # printer utilities
 #
 
+def __write_profile__(fname, profiler, rows):
+    """Dumps profiler totals and per-row averages as JSON to stderr ("-")
+       or a file."""
+    if fname == "-":
+        profiler.dump(sys.stderr, rows)
+        return
+    with open(fname, "w") as f:
+        profiler.dump(f, rows)
+    return
+
+def __write_memo__(test):
+    """Reports on stderr how many rows reused remembered results."""
+    total = test.memo_hits + test.memo_constants + test.memo_misses
+    sys.stderr.write("memo: reused %d of %d rows (%d constant)\n"
+                     % (test.memo_hits + test.memo_constants, total,
+                        test.memo_constants))
+    return
+
 def __write_header__(foutput, periods, summary=False):
     if summary:
         foutput.write("#")
@@ -133,17 +447,21 @@ def __write_header__(foutput, periods, summary=False):
     return
 
 def __write_data__(foutput, name, test, summary=False):
+    __write_result__(foutput, name, test.best, test.results, summary)
+    return
+
+def __write_result__(foutput, name, best, results, summary=False):
     if summary:
         foutput.write(name)
-        est_amp,_,_,_,_ = test.best
-        for period in sorted(test.results.keys()):
-            offset, k_score, p_value = test.results[period]
+        est_amp,_,_,_,_ = best
+        for period in sorted(results.keys()):
+            offset, k_score, p_value = results[period]
             outstr = str(p_value)+";"+str(period)+";"+str(offset)+";"+str(est_amp)
             foutput.write("\t" + outstr)
         else:
             foutput.write("\n")
     else:
-        est_amp, period, offset, k_score, p_value = test.best
+        est_amp, period, offset, k_score, p_value = best
         foutput.write(name+"\t"
                       +str(p_value)+"\t"
                       +str(est_amp)+"\t"
@@ -158,6 +476,12 @@ def __write_data__(foutput, name, test, summary=False):
 # runner script utilities
 #
 
+def __output_file__(astr):
+    """Opens a results file for appending, or returns stdout for "-"."""
+    if astr == "-":
+        return sys.stdout
+    return argparse.FileType('a')(astr)
+
 def __create_parser__():
     p = argparse.ArgumentParser(
         description="python script runner for JTK_CYCLE statistical test",
@@ -246,11 +570,11 @@ def __create_parser__():
                        metavar="FILENM",
                        default="-",
                        type=argparse.FileType('r'),
-                       help="file from which to read data (dflt: stdin)")
+                       help="data table or converted bundle (dflt: stdin)")
     files.add_argument("-o", "--output",
                        dest="ofile",
                        metavar="FILENM",
-                       type=argparse.FileType('w'),
+                       type=__output_file__,
                        default="-",
                        help="file to write results (dflt: stdout)")
     files.add_argument("-c", "--config",
@@ -258,16 +582,220 @@ def __create_parser__():
                        metavar="FILENM",
                        type=argparse.FileType('r'),
                        help="read {reps,times,periods,density} from JSON")
+    files.add_argument("--shard",
+                       metavar="i/N",
+                       type=str,
+                       help="process only the i-th of N slices of the input")
+    files.add_argument("--checkpoint",
+                       metavar="FILENM",
+                       type=str,
+                       help="record progress to FILENM while running")
+    files.add_argument("--checkpoint-every",
+                       dest="checkpoint_every",
+                       metavar="N",
+                       type=int,
+                       default=10000,
+                       help="record progress every N rows (dflt: 10000)")
+    files.add_argument("--resume",
+                       action='store_true',
+                       default=False,
+                       help="continue the run recorded in --checkpoint, if any")
+    files.add_argument("--build-library",
+                       dest="build_library",
+                       metavar="FILENM",
+                       type=str,
+                       help="write the reference library bundle and exit")
+    files.add_argument("--library",
+                       metavar="FILENM",
+                       type=str,
+                       help="memory-map a reference library bundle")
+    files.add_argument("--cache",
+                       metavar="DIR",
+                       type=str,
+                       help="directory caching exact null distributions")
+    files.add_argument("--cache-size",
+                       dest="cache_size",
+                       metavar="MB",
+                       type=float,
+                       default=512,
+                       help="evict least recently used entries above MB")
+
+    compute = p.add_argument_group(title="computation options")
+    compute.add_argument("-b", "--batch",
+                         metavar="N",
+                         type=int,
+                         default=0,
+                         help="score N series per matrix block (dflt: off)")
+    compute.add_argument("-j", "--workers",
+                         metavar="N",
+                         type=int,
+                         default=0,
+                         help="score blocks on N worker processes (dflt: off)")
+    compute.add_argument("--sort-threshold",
+                         dest="threshold",
+                         metavar="N",
+                         type=int,
+                         default=statistic.SORTED_THRESHOLD,
+                         help="score series longer than N by sorting (dflt: %d)"
+                         % statistic.SORTED_THRESHOLD)
+    compute.add_argument("--pipeline",
+                         action='store_true',
+                         default=False,
+                         help="overlap reading, scoring and writing on threads")
+    compute.add_argument("--queue-depth",
+                         dest="queue_depth",
+                         metavar="N",
+                         type=int,
+                         default=8,
+                         help="blocks buffered between pipeline stages (dflt: 8)")
+    compute.add_argument("--profile-report",
+                         dest="profile_report",
+                         metavar="FILENM",
+                         nargs='?',
+                         const="-",
+                         help="write timers and counters as JSON (dflt: stderr)")
+    compute.add_argument("--prune",
+                         action='store_true',
+                         default=False,
+                         help="skip references that cannot reach the best p-value")
+    compute.add_argument("--memo",
+                         metavar="N",
+                         type=int,
+                         default=0,
+                         help="reuse results of the N latest rank patterns (dflt: off)")
 
     printer = p.add_argument_group(title="result output preferences")
     printer.add_argument("-s", "--summary",
                          action='store_true',
                          default=False,
                          help="print summary over all searched periods")
+    printer.add_argument("--significant",
+                         action='store_true',
+                         default=False,
+                         help="only write series with p-value at most P (-p)")
+    printer.add_argument("--fdr",
+                         action='store_true',
+                         default=False,
+                         help="add Benjamini-Hochberg q-values as last column")
+    printer.add_argument("--fdr-memory",
+                         dest="fdr_memory",
+                         metavar="MB",
+                         type=int,
+                         default=64,
+                         help="memory for sorting p-values, in MB (dflt: 64)")
     
     return p
 
+#
+# subcommands
+#
+
+def convert(argv):
+    """Converts a tab-delimited table with a ZT header to a binary bundle,
+       usable as --input for later runs."""
+    p = argparse.ArgumentParser(
+        prog="run_JTKCYCLE.py convert",
+        description="convert a ZT-headed data table to a binary bundle"
+        )
+    p.add_argument("-i", "--input",
+                   dest="ifile",
+                   metavar="FILENM",
+                   default="-",
+                   type=argparse.FileType('r'),
+                   help="file from which to read data (dflt: stdin)")
+    p.add_argument("-o", "--output",
+                   dest="ofile",
+                   metavar="FILENM",
+                   required=True,
+                   type=str,
+                   help="bundle file to write")
+    p.add_argument("--dtype",
+                   metavar="$DTYPE",
+                   choices=["float32", "float64"],
+                   default="float64",
+                   help="float32 or float64 (dflt) value storage")
+    args = p.parse_args(argv)
+
+    convert_bundle(DataParser(args.ifile, True), args.ofile, args.dtype)
+    args.ifile.close()
+    return
+
+def merge(argv):
+    """Concatenates the outputs of every shard of a --shard run in input
+       order, after checking that no shard is missing or unfinished."""
+    p = argparse.ArgumentParser(
+        prog="run_JTKCYCLE.py merge",
+        description="merge the outputs of a run split with --shard"
+        )
+    p.add_argument("shards",
+                   metavar="FILENM",
+                   nargs="+",
+                   help="output file of each shard, in any order")
+    p.add_argument("-o", "--output",
+                   dest="ofile",
+                   metavar="FILENM",
+                   default="-",
+                   type=argparse.FileType('w'),
+                   help="file to write merged results (dflt: stdout)")
+    p.add_argument("--fdr",
+                   action='store_true',
+                   default=False,
+                   help="add Benjamini-Hochberg q-values over all shards")
+    p.add_argument("--fdr-memory",
+                   dest="fdr_memory",
+                   metavar="MB",
+                   type=int,
+                   default=64,
+                   help="memory for sorting p-values, in MB (dflt: 64)")
+    args = p.parse_args(argv)
+
+    try:
+        if args.fdr:
+            merged = tempfile.TemporaryFile()
+            rows = sh.merge_shards(args.shards, merged)
+            merged.seek(0)
+            fdr.append_qvalues(merged, args.ofile, args.fdr_memory * 2**20)
+            merged.close()
+        else:
+            rows = sh.merge_shards(args.shards, args.ofile)
+    except ValueError as e:
+        p.error(str(e))
+    args.ofile.close()
+    sys.stderr.write("merged %d shards, %d rows\n" % (len(args.shards), rows))
+    return
+
+SUBCOMMANDS = {
+    "convert": convert,
+    "merge": merge,
+    }
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+        sys.exit(0)
     parser = __create_parser__()
     args = parser.parse_args()
+    if args.prune and (args.summary or args.batch or args.workers
+                       or args.pipeline):
+        parser.error("--prune cannot be combined with -s, -b, -j or --pipeline")
+    if args.checkpoint:
+        if args.ifile is sys.stdin or args.ofile is sys.stdout:
+            parser.error("--checkpoint needs -i and -o files")
+        if zipfile.is_zipfile(args.ifile.name) or args.pipeline:
+            parser.error("--checkpoint needs a text input, without --pipeline")
+    if args.shard:
+        try:
+            args.shard = sh.parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.ifile is sys.stdin or args.ofile is sys.stdout:
+            parser.error("--shard needs -i and -o files")
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint")
+    if args.profile_report and args.workers:
+        parser.error("--profile-report cannot be combined with -j")
+    if args.fdr and (args.summary or args.significant or args.shard
+                     or args.checkpoint):
+        parser.error("--fdr cannot be combined with -s, --significant, "
+                     "--shard or --checkpoint; merge shards with --fdr")
     main(args)
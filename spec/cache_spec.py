@@ -0,0 +1,75 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(os.path.join(q[0], "src"))
+del p, q # keep globals clean
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+import cache as c
+
+class StoreSpec(unittest.TestCase):
+    """Describe storage and retrieval of cache entries."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.case = c.DistributionCache(self.directory)
+
+    def test_miss(self):
+        """It should report a miss for unknown keys."""
+        self.assertEqual(self.case.load(self.case.key("nothing")), None)
+
+    def test_round_trip(self):
+        """It should load stored arrays memory-mapped with metadata."""
+        key = self.case.key("harding", [1,2,3])
+        expect = np.random.random(25)
+        self.case.store(key, expect, {"max_score": 12.0})
+
+        actual, meta = self.case.load(key)
+        self.assertTrue(isinstance(actual, np.memmap))
+        self.assertTrue(np.all(expect == actual))
+        self.assertEqual(meta["max_score"], 12.0)
+
+    def test_keys(self):
+        """It should hash distinct parts to distinct keys."""
+        self.assertEqual(self.case.key("a", [1,2]), self.case.key("a", [1,2]))
+        self.assertNotEqual(self.case.key("a", [1,2]), self.case.key("a", [2,1]))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+class EvictionSpec(unittest.TestCase):
+    """Describe least-recently-used eviction."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.case = c.DistributionCache(self.directory, 2000)
+
+    def test_eviction(self):
+        """It should evict the least recently used entry when over size."""
+        array = np.zeros(100) # ~900 bytes on disk.
+        self.case.store("a", array, {})
+        self.case.store("b", array, {})
+        past = time.time() - 60
+        os.utime(os.path.join(self.directory, "b.npy"), (past, past))
+        os.utime(os.path.join(self.directory, "a.npy"), (past, past + 1))
+
+        self.case.store("c", array, {})
+        self.assertEqual(self.case.load("b"), None)
+        self.assertNotEqual(self.case.load("a"), None)
+        self.assertNotEqual(self.case.load("c"), None)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+if __name__ == "__main__":
+    unittest.main()
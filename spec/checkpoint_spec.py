@@ -0,0 +1,63 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(os.path.join(q[0], "src"))
+del p, q # keep globals clean
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from checkpoint import Checkpoint
+
+class CheckpointSpec(unittest.TestCase):
+    """Describe recording and reloading the progress of a run."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "run.ckpt")
+        self.settings = {"reps": [1.0, 2.0], "periods": [24.0],
+                         "density": None}
+        self.output = open(os.path.join(self.directory, "out.txt"), "a")
+
+    def test_missing(self):
+        """It should report no record before one was saved."""
+        self.assertEqual(Checkpoint(self.path, self.settings).load(), None)
+
+    def test_cadence(self):
+        """It should only save once enough rows were done, or forced."""
+        case = Checkpoint(self.path, self.settings, every=10)
+        self.output.write("header\n")
+        case.update(self.output, 100, 5)
+        self.assertFalse(os.path.exists(self.path))
+
+        self.output.write("row\n" * 10)
+        case.update(self.output, 200, 10)
+        state = Checkpoint(self.path, self.settings).load()
+        self.assertEqual((state["offset"], state["rows"]), (200, 10))
+        self.assertEqual(state["output"], len("header\n" + "row\n" * 10))
+
+        case.update(self.output, 210, 12)
+        self.assertEqual(Checkpoint(self.path, self.settings).load()["rows"],
+                         10)
+        case.update(self.output, 210, 12, force=True)
+        self.assertEqual(Checkpoint(self.path, self.settings).load()["rows"],
+                         12)
+
+    def test_settings(self):
+        """It should refuse records made with other settings."""
+        Checkpoint(self.path, self.settings).save(10, 20, 1)
+        other = dict(self.settings, periods=[22.0, 24.0])
+        self.assertRaises(ValueError, Checkpoint(self.path, other).load)
+
+    def tearDown(self):
+        self.output.close()
+        shutil.rmtree(self.directory)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(os.path.join(q[0], "src"))
+del p, q # keep globals clean
+
+import StringIO
+import unittest
+import numpy as np
+
+import fdr
+
+def bh(ps):
+    """Textbook Benjamini-Hochberg q-values of the tested p-values."""
+    ps = np.array(ps, dtype='float')
+    Q = np.empty(len(ps))
+    Q.fill(np.nan)
+    tested = np.flatnonzero(~np.isnan(ps))
+    m = len(tested)
+    for i in tested:
+        Q[i] = min(1.0, min(ps[j] * m / np.sum(ps[tested] <= ps[j])
+                            for j in tested if ps[j] >= ps[i]))
+    return Q
+
+class QValueSpillSpec(unittest.TestCase):
+    """Describe bounded-memory Benjamini-Hochberg q-values."""
+
+    def setUp(self):
+        self.ps = np.round(np.random.random(200), 2)
+        self.ps[::17] = np.nan
+        self.ps[5::31] = 1.0
+
+    def qvalues(self, memory):
+        spill = fdr.QValueSpill(memory)
+        try:
+            for p in self.ps:
+                spill.add(p)
+            spilled = len(spill.runs) > 0
+            return np.array(spill.qvalues()), spilled
+        finally:
+            spill.close()
+
+    def test_in_memory(self):
+        """It should match the textbook q-values when nothing spills."""
+        Q, spilled = self.qvalues(2**20)
+        self.assertFalse(spilled)
+        np.testing.assert_allclose(Q, bh(self.ps))
+
+    def test_spilled(self):
+        """It should give the same q-values from runs merged on disk."""
+        expect, _ = self.qvalues(2**20)
+        for memory in [16, 160, 1000]:
+            Q, spilled = self.qvalues(memory)
+            self.assertTrue(spilled)
+            np.testing.assert_array_equal(Q, expect)
+
+    def test_append(self):
+        """It should add a q-value column to every row, in input order."""
+        lines = ["#\tp-value\n"] + ["g%d\t%s\n" % (i, p)
+                                   for i,p in enumerate(self.ps)]
+        foutput = StringIO.StringIO()
+        fdr.append_qvalues(StringIO.StringIO("".join(lines)), foutput, 160)
+        rows = foutput.getvalue().splitlines()
+        self.assertEqual(rows[0], "#\tp-value\tq-value")
+        Q = [float(row.split("\t")[2]) for row in rows[1:]]
+        np.testing.assert_allclose(Q, bh(self.ps))
+
+if __name__ == "__main__":
+    unittest.main()
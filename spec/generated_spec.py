@@ -69,6 +69,12 @@ class SeriesSpec(unittest.TestCase):
         self.assertEqual(self.distribution_size, series.shape[0])
         self.assertEqual(TEST_N, series.shape[1])
     
+    def test_sorted_scores(self):
+        """It stores absolute scores in ascending order."""
+        scores = self.case.scores[TEST_N]
+        self.assertTrue(np.all(np.diff(scores) >= 0))
+        self.assertTrue(np.all(scores >= 0))
+
     def test_series_values(self):
         """It should generate values with appropriate bounds."""
         series = self.case.__make_series__(TEST_N)
@@ -90,6 +96,23 @@ class PValueSpec(unittest.TestCase):
         actual = self.case.p_value(0, period=self.period)
         self.assertEqual(expect, actual)
     
+    def test_array(self):
+        """It should answer arrays of scores with monotone p-values."""
+        scores = np.array([0, 5, 10, 20, MAX_S])
+        actual = self.case.p_value(scores, period=self.period)
+        self.assertEqual(actual.shape, scores.shape)
+        self.assertEqual(actual[0], 1.0)
+        self.assertTrue(np.all(np.diff(actual) <= 0))
+        for S,p in zip(scores, actual):
+            self.assertEqual(p, self.case.p_value(-S, period=self.period))
+
+    def test_counting(self):
+        """It should report the fraction of null scores at least |S|."""
+        scores = self.case.scores[self.period]
+        S = scores[len(scores) // 2]
+        expect = np.sum(scores >= S) / float(self.case.N)
+        self.assertEqual(expect, self.case.p_value(S, period=self.period))
+
     def test_maximum(self):
         """It should report significant values for a high score."""
         actual = self.case.p_value(MAX_S, period=self.period)
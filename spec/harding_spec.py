@@ -8,9 +8,13 @@ q = os.path.split(os.path.dirname(p))
 sys.path.append(os.path.join(q[0], "src"))
 del p, q # keep globals clean
 
+import shutil
+import tempfile
 import unittest
+import numpy as np
 import harding as hd
 import utility as u
+from cache import DistributionCache
 
 class DistributionSpec(unittest.TestCase):
     """Describe the cumulative distribution function of Harding Class."""
@@ -89,11 +93,70 @@ class DistributionSpec(unittest.TestCase):
     def tearDown(self):
         pass
 
+class LargeDesignSpec(unittest.TestCase):
+    """Describe distributions whose raw counts exceed the float range."""
+
+    def test_no_overflow(self):
+        """It should build a finite, monotone, centered distribution."""
+        case = hd.HardingDistribution(u.make_times(96, 3))
+        self.assertTrue(np.all(np.isfinite(case.cdf)))
+        self.assertEqual(case.cdf[0], 1.0)
+        self.assertTrue(np.all(np.diff(case.cdf) <= 0))
+        self.assertTrue(abs(case.cdf[int(case.max_score)] - 0.5) < 0.01)
+
+    def test_recurrence_steps(self):
+        """It should multiply and divide coefficient arrays exactly."""
+        case = hd.HardingDistribution(u.make_times(3))
+        cf = np.ones(6, dtype='float')
+        work = np.zeros(12, dtype='float')
+        case._divide(cf, 2, work)
+        self.assertEqual(list(cf), [1, 1, 2, 2, 3, 3])
+        case._multiply(cf, 2, work)
+        self.assertEqual(list(cf), [1, 1, 1, 1, 1, 1])
+
+class CacheSpec(unittest.TestCase):
+    """Describe reuse of cached distributions."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DistributionCache(self.directory)
+
+    def test_cached_cdf(self):
+        """It should load the identical distribution on a second build."""
+        times = u.make_times(4, [2,3,2,1])
+        expect = hd.HardingDistribution(times)
+        first = hd.HardingDistribution(times, cache=self.cache)
+        second = hd.HardingDistribution(times[::-1], cache=self.cache)
+
+        self.assertTrue(isinstance(second.cdf, np.memmap))
+        self.assertEqual(expect.max_score, second.max_score)
+        self.assertTrue(np.all(expect.cdf == first.cdf))
+        self.assertTrue(np.all(expect.cdf == second.cdf))
+        self.assertEqual(expect.p_value(7), second.p_value(7))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
 class PValueSpec(unittest.TestCase):
     """Describe p-value generating methods in Harding Distribution."""
     
     def setUp(self):
-        pass
+        self.case = hd.HardingDistribution(u.make_times(4, [2,3,2,1]))
+    
+    def test_zero(self):
+        """It should report 1.0 for a zero score."""
+        self.assertEqual(self.case.p_value(0), 1.0)
+        self.assertEqual(self.case.p_value(None), 1.0)
+    
+    def test_arrays(self):
+        """It should map arrays of scores to arrays of p-values."""
+        M = int(self.case.max_score)
+        scores = np.arange(-M, M + 1).reshape(-1, 1) * np.ones((1, 3))
+        actual = self.case.p_value(scores)
+        self.assertEqual(actual.shape, scores.shape)
+        for S,p in zip(scores[:,0], actual[:,0]):
+            self.assertEqual(self.case.p_value(S), p)
+        self.assertEqual(actual[M,0], 1.0)
     
     def tearDown(self):
         pass
@@ -57,6 +57,16 @@ class JTKCycleSpec(unittest.TestCase):
         (offset, k_score) = self.case.run(q)
         self.assertEqual(len(self.case.results), 12)
     
+    def test_sorted_run(self):
+        """It should give identical scores when scoring by sorting."""
+        case = JTKCycle(24, 2*np.ones(12), np.arange(0,24,2), 2, threshold=0)
+        self.assertTrue(case.sorted)
+        series = np.round(np.random.random(24), 1)
+        expect = self.case.run(statistic._tau_vector(series))
+        actual = case.run(series)
+        self.assertEqual(expect, actual)
+        self.assertEqual(self.case.results, case.results)
+
     def test_expansion(self):
         """It should appropriately expand a time series based on time_reps."""
         expect = np.array([ 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5,
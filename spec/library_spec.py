@@ -0,0 +1,79 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(os.path.join(q[0], "src"))
+del p, q # keep globals clean
+
+import os
+import tempfile
+import unittest
+import numpy as np
+
+import library as lib
+from main import JTKCycleRun
+
+TEST_N = 12
+KEY = {"periods": [8, 12, 24], "density": 2}
+
+class BundleSpec(unittest.TestCase):
+    """Describe saving and memory-mapping reference library bundles."""
+
+    def setUp(self):
+        self.test = JTKCycleRun(np.ones(TEST_N), 2 * np.arange(TEST_N),
+                                [8,12,24], 2)
+        fd, self.path = tempfile.mkstemp(suffix=".npz")
+        os.close(fd)
+        lib.build_library(self.test, KEY).save(self.path)
+
+    def test_round_trip(self):
+        """It should memory-map the int8 reference matrix with its lag table."""
+        case = lib.load_library(self.path)
+        R, _ = self.test.generate_reference_matrix()
+        self.assertTrue(isinstance(case.matrix, np.memmap))
+        self.assertEqual(case.matrix.dtype, np.int8)
+        self.assertTrue(np.all(case.matrix.T == R))
+        self.assertTrue(np.all(case.periods == self.test.__ref_periods__))
+        self.assertTrue(np.all(case.offsets == self.test.__ref_offsets__))
+
+    def test_unique(self):
+        """It should map the unique references scored against, not copy."""
+        case = JTKCycleRun(np.ones(TEST_N), 2 * np.arange(TEST_N),
+                           [8,12,24], 2, library=lib.load_library(self.path))
+        U, index, signs = case.generate_unique_matrix()
+        V, expect_index, expect_signs = self.test.generate_unique_matrix()
+        self.assertEqual(U.filename, os.path.realpath(self.path))
+        self.assertEqual(U.dtype, np.float32)
+        self.assertTrue(np.all(U == V))
+        self.assertTrue(np.all(index == expect_index))
+        self.assertTrue(np.all(signs == expect_signs))
+
+    def test_check(self):
+        """It should reject a key for a different design."""
+        case = lib.load_library(self.path)
+        case.check(KEY)
+        self.assertRaises(ValueError, case.check, {"periods": [24]})
+
+    def test_run(self):
+        """It should give the same results as freshly built references."""
+        case = JTKCycleRun(np.ones(TEST_N), 2 * np.arange(TEST_N),
+                           [8,12,24], 2, library=lib.load_library(self.path))
+        X = np.round(np.random.random((5, TEST_N)), 1)
+        for i in range(5):
+            self.assertEqual(self.test.run(X[i,:]), case.run(X[i,:]))
+            self.assertEqual(self.test.results, case.results)
+
+    def test_mismatch(self):
+        """It should refuse a library built for other references."""
+        case = JTKCycleRun(np.ones(TEST_N), 2 * np.arange(TEST_N),
+                           [8,12], 2, library=lib.load_library(self.path))
+        self.assertRaises(ValueError, case.generate_reference_matrix)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+if __name__ == "__main__":
+    unittest.main()
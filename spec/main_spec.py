@@ -13,6 +13,7 @@ import random
 import unittest
 
 from main import JTKCycleRun
+import statistic
 from harding import HardingDistribution
 from normal import NormalDistribution
 
@@ -84,12 +85,237 @@ class RunSeriesSpec(unittest.TestCase):
     def tearDown(self):
         pass
 
+class RunMatrixSpec(unittest.TestCase):
+    """Describe the matrix-batched JTK Cycle runner."""
+
+    def setUp(self):
+        self.case = JTKCycleRun(np.ones(TEST_N),
+                                2 * np.arange(TEST_N),
+                                [8,12,16,20,24],
+                                2,
+                                distribution="harding",
+                                block_size=4)
+
+    def test_run_matrix(self):
+        """It should reproduce the row-by-row results for every row."""
+        X = np.round(np.random.random((10, TEST_N)), 1)
+        X[0,:] = 1.0
+        bests, results = self.case.run_matrix(X)
+        self.assertEqual(len(bests), 10)
+        for i in range(10):
+            expect = self.case.run(X[i,:])
+            self.assertEqual(expect, bests[i])
+            self.assertEqual(self.case.results, results[i])
+
+    def test_run_matrix_sorted(self):
+        """It should reproduce the results when scoring by sorting."""
+        case = JTKCycleRun(np.ones(TEST_N), 2 * np.arange(TEST_N),
+                           [8,12,16,20,24], 2, threshold=0)
+        X = np.round(np.random.random((3, TEST_N)), 1)
+        bests, results = case.run_matrix(X)
+        for i in range(3):
+            self.assertEqual(self.case.run(X[i,:]), bests[i])
+            self.assertEqual(self.case.results, results[i])
+
+    def test_unique_matrix(self):
+        """It should rebuild every reference from its unique column."""
+        for threshold in (TEST_N, 0):
+            case = JTKCycleRun(np.ones(TEST_N), 2 * np.arange(TEST_N),
+                               [20,22,24,26], None, threshold=threshold)
+            R, _ = case.generate_reference_matrix()
+            U, index, signs = case.generate_unique_matrix()
+            self.assertTrue(U.shape[1] < R.shape[1])
+            self.assertEqual(len(set(index)), U.shape[1])
+
+            X = np.round(np.random.random((3, TEST_N)), 1)
+            if case.sorted:
+                K = statistic.sorted_k_matrix(X, R)
+            else:
+                K = statistic._k_matrix(statistic._tau_matrix(X), R)
+            Ku, _ = case.__score_block__(X, U, case.distribution, [])
+            self.assertTrue(np.all(K == Ku))
+
+    def tearDown(self):
+        pass
+
+class PruneSpec(unittest.TestCase):
+    """Describe the branch-and-bound pruned search."""
+
+    def setUp(self):
+        args = (2 * np.ones(TEST_N), 2 * np.arange(TEST_N),
+                [20,22,24,26], None)
+        self.case = JTKCycleRun(*args)
+        self.pruned = JTKCycleRun(*args, prune=True)
+        self.cutoff = JTKCycleRun(*args, prune=True, cutoff=0.01)
+        times = np.repeat(2 * np.arange(TEST_N), 2)
+        self.X = np.round(np.random.random((8, 2 * TEST_N)), 1)
+        self.X[:4] += np.cos(2 * np.pi * times / 24)
+
+    def test_exact(self):
+        """It should find the same best results as the full search."""
+        for series in self.X:
+            self.assertEqual(self.case.run(series), self.pruned.run(series))
+        self.assertTrue(self.pruned.pruned > 0)
+
+    def test_counts(self):
+        """It should count every reference visited, pruned or not."""
+        for series in self.X:
+            self.pruned.run(series)
+        R,_ = self.pruned.generate_reference_matrix()
+        self.assertEqual(self.pruned.visited, len(self.X) * R.shape[1])
+        self.assertTrue(self.pruned.scored > 0)
+        self.assertTrue(self.pruned.scored + self.pruned.pruned
+                        <= self.pruned.visited)
+
+    def test_cutoff(self):
+        """It should keep exact results for rows passing the cutoff."""
+        for series in self.X:
+            expect = self.case.run(series)
+            actual = self.cutoff.run(series)
+            self.assertEqual(expect[-1] <= 0.01, actual[-1] <= 0.01)
+            if expect[-1] <= 0.01:
+                self.assertEqual(expect, actual)
+        self.assertTrue(self.cutoff.pruned > 0)
+
+class CutoffSpec(unittest.TestCase):
+    """Describe rejection of rows failing a significance cutoff."""
+
+    def setUp(self):
+        args = (2 * np.ones(TEST_N), 2 * np.arange(TEST_N), [20,24], None)
+        self.case = JTKCycleRun(*args)
+        self.cutoff = JTKCycleRun(*args, cutoff=0.01)
+        times = np.repeat(2 * np.arange(TEST_N), 2)
+        self.X = np.round(np.random.random((8, 2 * TEST_N)), 1)
+        self.X[:4] += 2 * np.cos(2 * np.pi * times / 24)
+
+    def test_run(self):
+        """It should only resolve best results of passing rows."""
+        for series in self.X:
+            expect = self.case.run(series)
+            actual = self.cutoff.run(series)
+            self.assertEqual(expect[-1], actual[-1])
+            if self.cutoff.passes(actual[-1]):
+                self.assertEqual(expect, actual)
+            else:
+                self.assertTrue(np.all(np.isnan(actual[:-1])))
+
+    def test_run_matrix(self):
+        """It should agree with rows run one by one."""
+        bests, _ = self.cutoff.run_matrix(self.X)
+        for series,best in zip(self.X, bests):
+            expect = self.cutoff.run(series)
+            self.assertEqual(expect[-1], best[-1])
+            if self.cutoff.passes(best[-1]):
+                self.assertEqual(expect, best)
+
+class MemoSpec(unittest.TestCase):
+    """Describe reuse of results across rows sharing a rank pattern."""
+
+    def setUp(self):
+        args = (np.ones(TEST_N), 2 * np.arange(TEST_N), [20,24], None)
+        self.case = JTKCycleRun(*args)
+        self.memo = JTKCycleRun(*args, memo=4)
+        X = np.round(np.random.random((4, TEST_N)), 1)
+        self.X = np.vstack([X, 3 * X + 1, np.ones((2, TEST_N))])
+
+    def test_run(self):
+        """It should reuse the scores, but not the amplitude, of a row."""
+        for series in self.X:
+            self.assertEqual(self.case.run(series), self.memo.run(series))
+            self.assertEqual(self.case.results, self.memo.results)
+        self.assertEqual(self.memo.memo_hits, 4)
+        self.assertEqual(self.memo.memo_constants, 1)
+
+    def test_run_matrix(self):
+        """It should score repeated patterns in a block only once."""
+        self.assertEqual(self.case.run_matrix(self.X),
+                         self.memo.run_matrix(self.X))
+        self.assertEqual(self.memo.memo_misses, 5)
+
+    def test_missing(self):
+        """It should count rows with missing values as misses."""
+        X = np.array(self.X)
+        X[:2,3] = np.nan
+        self.memo.run_matrix(X)
+        self.memo.run(X[0])
+        total = (self.memo.memo_hits + self.memo.memo_constants
+                 + self.memo.memo_misses)
+        self.assertEqual(total, X.shape[0] + 1)
+        self.assertEqual(self.memo.memo_misses, 8)
+
+    def test_evict(self):
+        """It should forget the least recently used pattern."""
+        memo = JTKCycleRun(np.ones(TEST_N), 2 * np.arange(TEST_N),
+                           [24], None, memo=2)
+        for i in [0, 1, 0, 2, 1]:
+            memo.run(self.X[i])
+        self.assertEqual(memo.memo_hits, 1)
+        self.assertEqual(memo.memo_misses, 4)
+
+class MissingValueSpec(unittest.TestCase):
+    """Describe scoring of series with missing values."""
+
+    def setUp(self):
+        self.reps = 2 * np.ones(TEST_N)
+        self.times = 2 * np.arange(TEST_N)
+        self.case = JTKCycleRun(self.reps, self.times, [12,16,20,24], 2)
+
+    def _reduced(self, drop):
+        """Run over the design without the dropped samples."""
+        reps = self.reps.copy()
+        for i in drop:
+            reps[i // 2] -= 1
+        keep = reps > 0
+        return JTKCycleRun(reps[keep], self.times[keep], [12,16,20,24], 2)
+
+    def test_masked_pairs(self):
+        """It should match a run over the reduced design."""
+        for drop in ([3], [4, 5], [0, 9, 17]):
+            series = list(np.random.random(2 * TEST_N))
+            for i in drop:
+                series[i] = None
+            reduced = self._reduced(drop)
+            expect = reduced.run([v for v in series if v is not None])
+            actual = self.case.run(series)
+            self.assertEqual(expect, actual)
+            self.assertEqual(reduced.results, self.case.results)
+
+    def test_buckets(self):
+        """It should score mixed rows by pattern, caching each pattern."""
+        X = np.random.random((6, 2 * TEST_N))
+        X[[1,4],3] = np.nan
+        X[2,[0,1]] = np.nan
+        bests, results = self.case.run_matrix(X)
+        self.assertEqual(len(self.case.__patterns__), 2)
+        for i in range(6):
+            self.assertEqual(self.case.run(X[i,:]), bests[i])
+            self.assertEqual(self.case.results, results[i])
+
+    def test_empty(self):
+        """It should report unit p-values for rows without pairs."""
+        series = [None] * (2 * TEST_N)
+        series[5] = 1.0
+        _,_,_,_,p_value = self.case.run(series)
+        self.assertEqual(p_value, 1.0)
+
 class BonferroniSpec(unittest.TestCase):
     def setUp(self):
         periods = [random.randint(1,10) for i in range(5)]
         self.case = JTKCycleRun(np.ones(TEST_N),2*np.arange(TEST_N),periods,1)
         self.factor = sum(periods)
     
+    def test_p_table(self):
+        """It should tabulate adjusted p-values for every |k-score|."""
+        table = self.case.p_table(self.case.periods[0])
+        M = int(self.case.distribution.max_score)
+        self.assertEqual(len(table), M + 1)
+        self.assertTrue(table is self.case.p_table(self.case.periods[0]))
+        for k in range(-M, M + 1):
+            expect = self.case.bonferroni_adjust(
+                self.case.distribution.p_value(k)
+                )
+            self.assertEqual(expect, table[abs(k)])
+
     def test_bonferroni(self):
         """It should apply a Bonferroni correction."""
         score = random.random() / self.factor
@@ -99,6 +99,14 @@ class LargeUnequalSpec(unittest.TestCase):
         self.assertEqual(round(self.case.p_value(250),2), 0.08)
         self.assertEqual(round(self.case.p_value(1492),2), 0.00)
     
+    def test_arrays(self):
+        """It should map arrays of scores to arrays of p-values."""
+        scores = np.array([[-100, 0, 99], [250, 1492, -1492]])
+        actual = self.case.p_value(scores)
+        self.assertEqual(actual.shape, (2, 3))
+        for S,p in zip(scores.flat, actual.flat):
+            self.assertEqual(self.case.p_value(S), p)
+    
     def tearDown(self):
         pass
 
@@ -9,9 +9,12 @@ sys.path.append(os.path.join(q[0], "src"))
 r = os.path.dirname(os.path.realpath(__file__))
 del p, q # keep globals clean
 
+import os
 import numpy as np
 import random
+import tempfile
 import unittest
+import StringIO
 
 import parsed as p
 
@@ -98,5 +101,166 @@ class PatterningSpec(unittest.TestCase):
     def tearDown(self):
         pass
 
+class BlockSpec(unittest.TestCase):
+    """Describe the bulk, chunked block reader."""
+    
+    def setUp(self):
+        header = open(r + "/header.mock", "r").readline().rstrip() + "\n"
+        rows = ["g%d\t" % i + "\t".join(str(10*i + j) for j in range(10))
+                for i in range(5)]
+        rows[3] = rows[3].replace("\t33\t", "\tNA\t")
+        self.text = header + "\n".join(rows) + "\n\n"
+    
+    def test_blocks(self):
+        """It should yield bounded blocks of names and float rows."""
+        case = p.DataParser(StringIO.StringIO(self.text))
+        blocks = list(case.generate_blocks(2))
+        self.assertEqual([len(names) for names,_ in blocks], [2, 2, 1])
+        self.assertEqual(blocks[1][0], ["g2", "g3"])
+        self.assertEqual(blocks[0][1].shape, (2, 10))
+        self.assertEqual(list(blocks[0][1][1,:]), range(10, 20))
+    
+    def test_offset(self):
+        """It should track and seek to byte offsets between blocks."""
+        case = p.DataParser(StringIO.StringIO(self.text))
+        offsets = []
+        for names,_ in case.generate_blocks(2):
+            offsets.append((case.offset, names))
+        self.assertEqual(case.offset, len(self.text))
+
+        resumed = p.DataParser(StringIO.StringIO(self.text))
+        resumed.seek(offsets[0][0])
+        rest = [names for names,_ in resumed.generate_blocks(2)]
+        self.assertEqual(rest, [names for _,names in offsets[1:]])
+
+    def test_shard(self):
+        """It should split rows into line-aligned byte ranges."""
+        header, body = self.text.split("\n", 1)
+        f = tempfile.NamedTemporaryFile()
+        f.write(header + "\n" + body * 7)
+        f.flush()
+        expect = [name for names,_ in
+                  p.DataParser(open(f.name)).generate_blocks(3)
+                  for name in names]
+        for n in (1, 2, 5, 60):
+            actual, spans = [], []
+            for i in range(n):
+                case = p.DataParser(open(f.name))
+                spans.append(case.shard(i, n))
+                actual.extend([name for names,_ in case.generate_blocks(2)
+                               for name in names])
+            self.assertEqual(actual, expect)
+            for (_,hi),(lo,_) in zip(spans, spans[1:]):
+                self.assertEqual(hi, lo)
+        f.close()
+
+    def test_missing(self):
+        """It should convert unparseable cells to nan."""
+        case = p.DataParser(StringIO.StringIO(self.text))
+        _,values = list(case.generate_blocks(10))[0]
+        self.assertTrue(np.isnan(values[3,3]))
+        self.assertEqual(np.sum(np.isnan(values)), 1)
+    
+    def test_blank(self):
+        """It should convert blank tab-delimited cells to nan."""
+        text = self.text.replace("\t12\t", "\t\t")
+        text = text.replace("\t49\n", "\t\n")
+        case = p.DataParser(StringIO.StringIO(text))
+        _,values = list(case.generate_blocks(10))[0]
+        self.assertEqual(values.shape, (5, 10))
+        self.assertTrue(np.isnan(values[1,2]))
+        self.assertTrue(np.isnan(values[4,9]))
+        self.assertEqual(np.sum(np.isnan(values)), 3)
+    
+    def test_repattern(self):
+        """It should repattern whole blocks like the per-row method."""
+        case = p.DataParser(StringIO.StringIO(self.text), True)
+        for name,series in case.generate_series():
+            i = int(name[1:])
+            raw = [10*i + j for j in range(10)]
+            expect = case.repattern(raw)
+            for a,b in zip(expect, series):
+                self.assertTrue(a == b or np.isnan(b))
+    
+    def test_spaces(self):
+        """It should split rows holding no tab on whitespace."""
+        text = self.text.replace("\t", "  ")
+        case = p.DataParser(StringIO.StringIO(text), True)
+        expect = list(p.DataParser(StringIO.StringIO(self.text), True)
+                      .generate_blocks(10))[0]
+        names,values = list(case.generate_blocks(10))[0]
+        self.assertEqual(names, expect[0])
+        np.testing.assert_array_equal(values, expect[1])
+
+    def test_untabbed(self):
+        """It should refuse rows whose values do not match the header."""
+        rows = self.text.split("\n")
+        rows[2] = rows[2].replace("\t", " ", 3)
+        case = p.DataParser(StringIO.StringIO("\n".join(rows)))
+        self.assertRaises(ValueError, list, case.generate_blocks(1))
+
+    def test_ragged(self):
+        """It should refuse blocks with differing numbers of values."""
+        case = p.DataParser(StringIO.StringIO(self.text + "g9\t1\t2\n"))
+        self.assertRaises(ValueError, list, case.generate_blocks(10))
+    
+    def tearDown(self):
+        pass
+
+class BundleSpec(unittest.TestCase):
+    """Describe conversion to, and reading of, binary bundles."""
+    
+    def setUp(self):
+        header = open(r + "/header.mock", "r").readline().rstrip() + "\n"
+        rows = ["g%d\t" % i + "\t".join(str(i + j / 10.) for j in range(10))
+                for i in range(7)]
+        rows[2] = rows[2].replace("\t2.3\t", "\tNA\t")
+        self.text = header + "\n".join(rows) + "\n"
+        fd, self.path = tempfile.mkstemp(suffix=".npz")
+        os.close(fd)
+        p.convert_bundle(p.DataParser(StringIO.StringIO(self.text)), self.path)
+    
+    def test_metadata(self):
+        """It should carry over names, reps and timepoints."""
+        expect = p.DataParser(StringIO.StringIO(self.text), True)
+        case = p.BundleParser(self.path)
+        self.assertEqual(case.reps, expect.reps)
+        self.assertEqual(case.timepoints, expect.timepoints)
+        self.assertEqual(list(case.names), ["g%d" % i for i in range(7)])
+    
+    def test_shard(self):
+        """It should split rows into equal row ranges."""
+        names = []
+        for i in range(3):
+            case = p.BundleParser(self.path, 2)
+            case.shard(i, 3)
+            names.extend([n for block,_ in case.generate_blocks()
+                          for n in block])
+        self.assertEqual(names, ["g%d" % i for i in range(7)])
+
+    def test_values(self):
+        """It should memory-map values in repatterned order."""
+        expect = p.DataParser(StringIO.StringIO(self.text), True)
+        case = p.BundleParser(self.path, 3)
+        self.assertTrue(isinstance(case.values, np.memmap))
+        
+        actual = list(case.generate_blocks())
+        self.assertEqual([len(names) for names,_ in actual], [3, 3, 1])
+        for (a,u),(b,v) in zip(expect.generate_series(),
+                               case.generate_series()):
+            self.assertEqual(a, b)
+            self.assertTrue(np.all((u == v) | (np.isnan(u) & np.isnan(v))))
+    
+    def test_ranges(self):
+        """It should slice row ranges without reading the whole matrix."""
+        case = p.BundleParser(self.path)
+        self.assertEqual(list(case.generate_ranges(4)), [(0, 4), (4, 7)])
+        names, values = case.block(4, 7)
+        self.assertEqual(names, ["g4", "g5", "g6"])
+        self.assertEqual(values.shape, (3, 10))
+    
+    def tearDown(self):
+        os.remove(self.path)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(os.path.join(q[0], "src"))
+del p, q # keep globals clean
+
+import time
+import random
+import unittest
+
+import pipeline as pl
+
+class Handle:
+    """Stand-in for a pool AsyncResult finishing after a random delay."""
+
+    def __init__(self, text):
+        self.text = text
+
+    def get(self):
+        time.sleep(random.random() * 0.002)
+        return self.text
+
+class PipelineSpec(unittest.TestCase):
+    """Describe the threaded reader, compute and writer pipeline."""
+
+    def setUp(self):
+        self.written = []
+        self.blocks = [str(i) + "\n" for i in range(100)]
+
+    def test_order(self):
+        """It should write every result in input order."""
+        pl.run_pipeline(iter(self.blocks), Handle, self.written.append,
+                        depth=2)
+        self.assertEqual("".join(self.written), "".join(self.blocks))
+
+    def test_buffered(self):
+        """It should gather results into chunks of the buffer size."""
+        pl.run_pipeline(iter(self.blocks), lambda b: b,
+                        self.written.append, buffer_size=50)
+        self.assertEqual("".join(self.written), "".join(self.blocks))
+        for chunk in self.written[:-1]:
+            self.assertTrue(len(chunk) >= 50)
+
+    def test_reader_error(self):
+        """It should re-raise failures of the reader."""
+        def blocks():
+            yield "a"
+            raise ValueError("unreadable")
+        self.assertRaises(ValueError, pl.run_pipeline, blocks(),
+                          lambda b: b, self.written.append)
+
+    def test_writer_error(self):
+        """It should stop and re-raise failures of the writer."""
+        def write(text):
+            raise IOError("disk full")
+        self.assertRaises(IOError, pl.run_pipeline, iter(self.blocks),
+                          lambda b: b, write, depth=1, buffer_size=1)
+
+    def test_submit_error(self):
+        """It should stop and re-raise failures of the compute stage."""
+        def submit(block):
+            if block == "50\n":
+                raise ArithmeticError("bad block")
+            return block
+        self.assertRaises(ArithmeticError, pl.run_pipeline,
+                          iter(self.blocks), submit, self.written.append,
+                          depth=1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(os.path.join(q[0], "src"))
+del p, q # keep globals clean
+
+import json
+import StringIO
+import unittest
+import numpy as np
+
+from profiler import Profiler
+from main import JTKCycleRun
+
+TEST_N = 12
+
+class ProfilerSpec(unittest.TestCase):
+    """Describe the accumulation of timers and counters."""
+
+    def setUp(self):
+        ticks = iter(range(100))
+        self.case = Profiler(clock=lambda: next(ticks))
+
+    def test_wrap(self):
+        """It should time and count calls of a wrapped function."""
+        square = self.case.wrap("square", lambda x: x * x)
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square(4), 16)
+        self.assertEqual(self.case.calls["square"], 2)
+        self.assertEqual(self.case.totals["square"], 2)
+
+    def test_report(self):
+        """It should report totals, per-row averages and counters."""
+        self.case.add("stage", 4.0, calls=2)
+        self.case.count("hits")
+        self.case.count("hits", 2)
+
+        f = StringIO.StringIO()
+        self.case.dump(f, 4)
+        report = json.loads(f.getvalue())
+        self.assertEqual(report["rows"], 4)
+        self.assertEqual(report["counters"], {"hits": 3})
+        self.assertEqual(report["timers"]["stage"]["seconds_per_row"], 1.0)
+        self.assertEqual(report["timers"]["stage"]["calls_per_row"], 0.5)
+
+class InstrumentedRunSpec(unittest.TestCase):
+    """Describe a JTKCycleRun instrumented by a profiler."""
+
+    def setUp(self):
+        self.profiler = Profiler()
+        args = (np.ones(TEST_N), 2 * np.arange(TEST_N), [20,24], None)
+        self.case = JTKCycleRun(*args)
+        self.instrumented = JTKCycleRun(*args, profiler=self.profiler)
+
+    def test_run(self):
+        """It should leave results unchanged while counting hot paths."""
+        X = np.round(np.random.random((3, TEST_N)), 1)
+        for series in X:
+            self.assertEqual(self.case.run(series),
+                             self.instrumented.run(series))
+
+        calls, counts = self.profiler.calls, self.profiler.counts
+        refs = sum(len(c.references) for c in self.case.cycles.values())
+        self.assertEqual(calls["run"], 3)
+        self.assertEqual(calls["tau_vector"], 3)
+        self.assertEqual(calls["reference_tau"], refs)
+        self.assertEqual(counts["references.miss"], refs)
+        self.assertEqual(counts["references.hit"], 2 * refs)
+        self.assertEqual(counts["cycles.miss"], 2)
+
+    def test_run_matrix(self):
+        """It should time the tau vectors of every scored block."""
+        X = np.round(np.random.random((3, TEST_N)), 1)
+        self.assertEqual(self.case.run_matrix(X),
+                         self.instrumented.run_matrix(X))
+        self.assertEqual(self.profiler.calls["tau_matrix"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
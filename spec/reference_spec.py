@@ -67,6 +67,41 @@ class RankingSpec(unittest.TestCase):
     def tearDown(self):
         pass
 
+class ReferenceBlockSpec(unittest.TestCase):
+    """Describe array-backed references over many offsets."""
+
+    def test_rows(self):
+        """It should match the Reference of every offset exactly."""
+        xs = np.arange(0,24,2, dtype='float')
+        offsets = np.arange(0, 24, 0.5)
+        step = lambda x: np.where(x % (2*np.pi) < np.pi, 1.0, 0.0)
+        for f in (np.cos, step):
+            for symmetry in (True, False):
+                block = R.ReferenceBlock(xs, 24, offsets, function=f,
+                                         symmetry=symmetry)
+                for i,offset in enumerate(offsets):
+                    case = R.Reference(xs, 24, offset, function=f,
+                                       symmetry=symmetry)
+                    self.assertTrue(np.all(block.values[i] == case.__values__))
+                    self.assertTrue(np.all(block.series[i] == case.series))
+                    self.assertTrue(np.all(block.signs[i] == case.signs))
+
+    def test_reference(self):
+        """It should hand out references sharing its rows."""
+        block = R.ReferenceBlock(range(0,24,2), 24, np.arange(0, 24))
+        case = block.reference(5)
+        self.assertEqual(case.offset, 5)
+        self.assertTrue(np.all(case.series == block.series[5]))
+
+    def test_fractional_ranks(self):
+        """It should rank every row of a block, ties included."""
+        block = [[1,3,2,2,5,4], [5,3,2,1,4,6], [2,2,2,1,1,1]]
+        ranked = R.fractional_ranks(block)
+        self.assertEqual(list(ranked[0]), [0.0, 0.6, 0.3, 0.3, 1.0, 0.8])
+        self.assertEqual(list(ranked[1]), [0.8, 0.4, 0.2, 0.0, 0.6, 1.0])
+        self.assertEqual(list(ranked[2][:3]), [0.8] * 3)
+        self.assertTrue(np.all(ranked[2][3:] < ranked[2][0]))
+
 class ReferenceSpec(unittest.TestCase):
     """Describe the reference time series class."""
     
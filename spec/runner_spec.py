@@ -0,0 +1,88 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(q[0])
+sys.path.append(os.path.join(q[0], "src"))
+r = os.path.dirname(p)
+del p, q # keep globals clean
+
+import os
+import json
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import run_JTKCYCLE as runner
+
+class Stdout(StringIO.StringIO):
+    """Stand-in for sys.stdout that keeps its text once closed."""
+    name = "<stdout>"
+
+    def close(self):
+        self.text = self.getvalue()
+
+class RunnerSpec(unittest.TestCase):
+    """Describe the command line runner."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input = os.path.join(self.directory, "data.txt")
+        header = open(r + "/header.mock", "r").readline().rstrip() + "\n"
+        rows = ["g%d\t" % i + "\t".join(str((i * j) % 7) for j in range(10))
+                for i in range(1, 6)]
+        with open(self.input, "w") as f:
+            f.write(header + "\n".join(rows) + "\n")
+
+    def run_main(self, argv):
+        stdout = sys.stdout
+        sys.stdout = out = Stdout()
+        try:
+            args = runner.__create_parser__().parse_args(argv)
+            runner.main(args)
+            return getattr(out, "text", out.getvalue())
+        finally:
+            sys.stdout = stdout
+
+    def test_stdout(self):
+        """It should write results to stdout when no output is given."""
+        output = os.path.join(self.directory, "out.txt")
+        self.run_main(["-i", self.input, "-o", output])
+        text = self.run_main(["-i", self.input])
+        self.assertEqual(len(text.splitlines()), 6)
+        self.assertEqual(text, open(output, "r").read())
+
+    def test_checkpoint_every(self):
+        """It should checkpoint serial runs at the argued cadence."""
+        with open(self.input, "a") as f:
+            f.write("g9\t1\t2\n") # ragged: the run fails on this row.
+        output = os.path.join(self.directory, "out.txt")
+        checkpoint = os.path.join(self.directory, "checkpoint.json")
+        argv = ["-i", self.input, "-o", output, "--checkpoint", checkpoint,
+                "--checkpoint-every", "2"]
+        self.assertRaises(ValueError, self.run_main, argv)
+        with open(checkpoint, "r") as f:
+            self.assertEqual(json.load(f)["rows"], 4)
+
+    def test_checkpoint_key(self):
+        """It should only resume runs over the same input and patterning."""
+        output = os.path.join(self.directory, "out.txt")
+        checkpoint = os.path.join(self.directory, "checkpoint.json")
+        argv = ["-i", self.input, "-o", output, "--checkpoint", checkpoint]
+        self.run_main(argv)
+        expect = open(output, "r").read()
+        self.assertRaises(ValueError, self.run_main, argv + ["--resume", "-r"])
+        with open(self.input, "a") as f:
+            f.write("g6\t" + "\t".join(["1"] * 10) + "\n")
+        self.assertRaises(ValueError, self.run_main, argv + ["--resume"])
+        self.assertEqual(open(output, "r").read(), expect)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+
+p = os.path.realpath(__file__)
+q = os.path.split(os.path.dirname(p))
+sys.path.append(os.path.join(q[0], "src"))
+del p, q # keep globals clean
+
+import os
+import shutil
+import tempfile
+import unittest
+import StringIO
+
+import shard as sh
+
+class ParseSpec(unittest.TestCase):
+    """Describe parsing of i/N shard specs."""
+
+    def test_parse(self):
+        """It should accept 0 <= i < N only."""
+        self.assertEqual(sh.parse_shard("2/8"), (2, 8))
+        for astr in ("8/8", "-1/8", "1/0", "1", "a/b"):
+            self.assertRaises(ValueError, sh.parse_shard, astr)
+
+class MergeSpec(unittest.TestCase):
+    """Describe merging of shard outputs."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.paths = []
+        bounds = [10, 40, 70, 100]
+        for i in range(3):
+            path = os.path.join(self.directory, "out%d.txt" % i)
+            with open(path, "w") as f:
+                f.write("#\theader\n" + "row%d\n" % i * (i + 1))
+            sh.write_manifest(path, i, 3, bounds[i:i+2], 100, i + 1)
+            self.paths.append(path)
+
+    def test_merge(self):
+        """It should write one header, then rows in shard order."""
+        out = StringIO.StringIO()
+        rows = sh.merge_shards(self.paths[::-1], out)
+        self.assertEqual(rows, 6)
+        self.assertEqual(out.getvalue(),
+                         "#\theader\nrow0\nrow1\nrow1\nrow2\nrow2\nrow2\n")
+
+    def test_missing(self):
+        """It should refuse to merge with a shard missing or unfinished."""
+        out = StringIO.StringIO()
+        self.assertRaises(ValueError, sh.merge_shards, self.paths[:2], out)
+        sh.clear_manifest(self.paths[1])
+        self.assertRaises(ValueError, sh.merge_shards, self.paths, out)
+
+    def test_foreign(self):
+        """It should refuse shards of another run."""
+        sh.write_manifest(self.paths[1], 1, 3, [40, 70], 99, 2)
+        self.assertRaises(ValueError, sh.merge_shards, self.paths,
+                          StringIO.StringIO())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -74,6 +74,104 @@ class StatisticSpec(unittest.TestCase):
         for p in zip(expect, actual):
             self.assertEqual(p[0],p[1])
     
+    def test_sorted_score(self):
+        """It should match the pairwise score, ties included."""
+        for n in (2, 7, 16, 33):
+            data = np.round(np.random.random(n), 1)
+            ref = np.round(np.random.random(n), 1)
+            expect = statistic.k_score(data, ref)
+            actual = statistic.sorted_k_score(data, ref)
+            self.assertEqual(expect, actual)
+
+    def test_sorted_score_trivial(self):
+        """It should generate a zero score for flatline series."""
+        self.assertEqual(statistic.sorted_k_score(np.ones(12),
+                                                  np.arange(12)), 0.0)
+        self.assertEqual(statistic.sorted_k_score(np.arange(12),
+                                                  np.arange(12)), 66.0)
+
+    def test_sorted_matrix(self):
+        """It should match the sorted score of every row and reference."""
+        data = np.round(np.random.random((7, 33)), 1)
+        refs = np.round(np.random.random((33, 5)), 1)
+        refs[:,0] = 1.0
+        expect = [[statistic.sorted_k_score(x, refs[:,j]) for j in range(5)]
+                  for x in data]
+        chunk = statistic.CHUNK
+        try:
+            statistic.CHUNK = 400 # two rows of 33 x 5 at a time.
+            actual = statistic.sorted_k_matrix(data, refs)
+        finally:
+            statistic.CHUNK = chunk
+        self.assertTrue(np.all(np.array(expect) == actual))
+        self.assertTrue(np.all(statistic.sorted_k_matrix(data, refs)
+                               == actual))
+
+    def test_discordant_matrix(self):
+        """It should count inverted pairs of every column."""
+        Y = np.array([[4,1],[3,3],[2,2],[1,2],[0,5],[0,4]])
+        self.assertEqual(list(statistic._discordant_matrix(Y)), [14, 3])
+
+    def test_discordant_pairs(self):
+        """It should count strictly inverted pairs."""
+        self.assertEqual(statistic._discordant_pairs([4,3,2,1]), 6)
+        self.assertEqual(statistic._discordant_pairs([1,3,2,2,5,4]), 3)
+
+    def test_query(self):
+        """It should hand back the raw series above the threshold."""
+        series = np.arange(10)
+        self.assertEqual(len(statistic.query(series, 20)), 45)
+        self.assertEqual(len(statistic.query(series, 5)), 10)
+
+    def test_compact_tau_vector(self):
+        """It should store signs as int8, reusing an argued buffer."""
+        data = np.random.random(12)
+        buf = np.zeros(66, dtype='int8')
+        actual = statistic._tau_vector(data, out=buf)
+        self.assertTrue(actual is buf)
+        self.assertEqual(actual.dtype, np.int8)
+        self.assertTrue(np.all(np.abs(actual) == 1))
+
+    def test_pair_plans(self):
+        """It should memoize read-only pair indices per length."""
+        xs,ys = statistic._tril_indices(9)
+        self.assertTrue(statistic._tril_indices(9)[0] is xs)
+        self.assertFalse(xs.flags.writeable)
+        expect = np.tril_indices(9, k=-1)
+        self.assertTrue(np.all(expect[0] == xs) and np.all(expect[1] == ys))
+
+    def test_exact_accumulation(self):
+        """It should not overflow for long int8 tau vectors."""
+        data = np.arange(400)
+        self.assertEqual(statistic.k_score(data, data), 400 * 399 / 2.)
+        q = statistic._tau_matrix(np.vstack((data, data[::-1])))
+        r = statistic._tau_vector(data)
+        self.assertEqual(list(statistic._k_matrix(q, r)), [79800., -79800.])
+
+    def test_tau_matrix(self):
+        """It should stack the tau vector of each row of a block."""
+        data = np.random.random((5, 8))
+        actual = statistic._tau_matrix(data)
+        self.assertEqual(actual.shape, (5, 28))
+        for i in range(5):
+            expect = statistic._tau_vector(data[i,:])
+            self.assertTrue(np.all(expect == actual[i,:]))
+
+    def test_chunks(self):
+        """It should give the same tau and k matrices in row chunks."""
+        data = np.round(np.random.random((7, 8)), 1)
+        R = statistic._tau_matrix(data[:3]).T
+        expect = statistic._k_matrix(statistic._tau_matrix(data), R)
+        chunk = statistic.CHUNK
+        try:
+            statistic.CHUNK = 60 # two rows of 28 pairs at a time.
+            Q = statistic._tau_matrix(data)
+            actual = statistic._k_matrix(Q, R)
+        finally:
+            statistic.CHUNK = chunk
+        self.assertTrue(np.all(statistic._tau_matrix(data) == Q))
+        self.assertTrue(np.all(expect == actual))
+
     def tearDown(self):
         pass
 
@@ -28,6 +28,14 @@ class ErrorFunctionSpec(unittest.TestCase):
         x = random.random()
         self.assertTrue(u.erf(2*x) >= u.erf(x))
     
+    def test_arrays(self):
+        """It should evaluate arrays elementwise."""
+        xs = np.linspace(-3, 3, 13)
+        actual = u.erf(xs)
+        for x,y in zip(xs, actual):
+            self.assertEqual(u.erf(x), y)
+        self.assertTrue(np.all(u.erfc(xs) == 1.0 - actual))
+
     def test_convergence(self):
         """It should converge to one."""
         within = lambda y,t: (1.0 - y) <= t
@@ -148,5 +148,30 @@ class StepSpec(unittest.TestCase):
         for y in ys[51:-1]:
             self.assertEqual(y, 0.0)
         
+class ArraySpec(unittest.TestCase):
+    """Describe evaluation of waveforms over whole arrays."""
+
+    def setUp(self):
+        self.waveforms = [w.ramp_up, w.ramp_down, w.impulse, w.step]
+        self.xs = np.linspace(-4*np.pi, 4*np.pi, 60).reshape((5, 12))
+
+    def test_scalar_agreement(self):
+        """It should match the elementwise values of every waveform."""
+        for f in self.waveforms:
+            for width in (None, np.pi/3, 3*np.pi/2):
+                ys = f(self.xs, width)
+                self.assertEqual(ys.shape, self.xs.shape)
+                expect = np.frompyfunc(lambda x: f(x, width), 1, 1)(self.xs)
+                self.assertTrue(np.all(ys == expect.astype('float')))
+
+    def test_width_grid(self):
+        """It should broadcast an array of widths against angles."""
+        widths = np.array([np.pi/4, np.pi, 3*np.pi/2])[:,np.newaxis]
+        for f in self.waveforms:
+            ys = f(self.xs[0], widths)
+            self.assertEqual(ys.shape, (3, 12))
+            for i,width in enumerate(widths[:,0]):
+                self.assertTrue(np.all(ys[i] == f(self.xs[0], width)))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+class DistributionCache:
+    """On-disk cache of finished null distribution arrays. Entries are
+       .npy files loaded memory-mapped, with a .json metadata sidecar, and
+       evicted least-recently-used first once over the size bound."""
+
+    def __init__(self, directory, max_bytes=512 * 2**20):
+        """Init w/: cache directory (created if absent), and size bound."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+
+    def key(self, *parts):
+        """Hashes JSON-serializable parts into an entry key."""
+        return hashlib.sha1(json.dumps(parts, sort_keys=True)).hexdigest()
+
+    def load(self, key):
+        """Returns (array, metadata) for a key, or None on a miss."""
+        path = self.__path__(key, ".npy")
+        try:
+            with open(self.__path__(key, ".json"), "r") as f:
+                meta = json.load(f)
+            array = np.load(path, mmap_mode='r')
+            os.utime(path, None) # mark as recently used.
+        except (IOError, OSError, ValueError):
+            return None
+        return (array, meta)
+
+    def store(self, key, array, meta):
+        """Atomically writes an entry, then evicts down to the size bound."""
+        self.__write__(self.__path__(key, ".json"),
+                       lambda f: json.dump(meta, f))
+        self.__write__(self.__path__(key, ".npy"),
+                       lambda f: np.save(f, np.asarray(array)))
+        self.evict(keep=key)
+        return
+
+    def evict(self, keep=None):
+        """Removes least-recently-used entries while over the size bound."""
+        entries = []
+        for fname in os.listdir(self.directory):
+            stem, ext = os.path.splitext(fname)
+            if ext != ".npy" or stem == keep:
+                continue
+            path = os.path.join(self.directory, fname)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, stem))
+
+        total = sum(size for _,size,_ in entries)
+        if keep is not None:
+            try:
+                total += os.path.getsize(self.__path__(keep, ".npy"))
+            except OSError:
+                pass
+
+        for _,size,stem in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for ext in (".npy", ".json"):
+                try:
+                    os.remove(self.__path__(stem, ext))
+                except OSError:
+                    pass
+            total -= size
+        return
+
+    def __path__(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def __write__(self, path, dump):
+        """Writes via a temporary file renamed into place, so concurrent
+           readers and writers never observe a partial entry."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                dump(f)
+            os.rename(tmp, path)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return
+
+if __name__ == "__main__":
+    print "This module holds an on-disk cache of null distributions."
@@ -0,0 +1,66 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import os
+import json
+import tempfile
+
+class Checkpoint:
+    """Progress record of a long run: the input byte offset just past the
+       last fully written row, and the output position after flushing it,
+       along with the settings of the run so a resumed run can check them.
+       The record is rewritten atomically every so many rows."""
+
+    def __init__(self, path, settings, every=10000):
+        """Init w/: record path, JSON-serializable settings, and cadence."""
+        self.path = path
+        self.settings = settings
+        self.every = every
+        self.rows = 0 # rows covered by the last saved record.
+
+    def load(self):
+        """Returns the saved record, having checked that it was recorded
+           with the same settings as this run, or None if there is none."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        if state["settings"] != self.settings:
+            raise ValueError("checkpoint was recorded with other settings.")
+        self.rows = state["rows"]
+        return state
+
+    def update(self, foutput, offset, rows, force=False):
+        """Flushes output and saves a record once enough rows are done.
+           Called at block boundaries, so records are at most that fine."""
+        if not force and rows - self.rows < self.every:
+            return
+        foutput.flush()
+        os.fsync(foutput.fileno())
+        self.save(offset, foutput.tell(), rows)
+
+    def save(self, offset, position, rows):
+        """Atomically replaces the record."""
+        state = {
+            "settings": self.settings,
+            "offset": offset,
+            "output": position,
+            "rows": rows,
+            }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f, sort_keys=True)
+            os.rename(tmp, self.path)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.rows = rows
+
+if __name__ == "__main__":
+    print "This module records checkpoints of long-running jobs."
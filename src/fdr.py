@@ -0,0 +1,125 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import os
+import heapq
+import itertools
+import shutil
+import tempfile
+import numpy as np
+
+# Benjamini-Hochberg q-values need every p-value in sorted order. Rows are
+# buffered as (row, p) records up to a memory cap, each full buffer being
+# sorted and spilled to disk as a run; the runs are then merged, walking
+# p-values from largest to smallest, and q-values land in a memory-mapped
+# array indexed by row, from which they are read back in input order.
+
+RECORD = np.dtype([("p", "float64"), ("row", "int64")])
+
+class QValueSpill:
+    """Bounded-memory Benjamini-Hochberg q-values of a stream of
+       p-values. Untested (NaN) p-values get NaN q-values and do not count
+       towards the number of tests."""
+
+    def __init__(self, memory=64 * 2**20, directory=None):
+        """Init w/: memory cap in bytes and a directory for spilled runs."""
+        self.capacity = max(1, int(memory) // RECORD.itemsize)
+        self.directory = tempfile.mkdtemp(dir=directory, suffix=".fdr")
+        self.buffer = np.empty(self.capacity, dtype=RECORD)
+        self.fill = 0
+        self.rows = 0 # rows seen, tested or not.
+        self.tests = 0
+        self.runs = []
+
+    def add(self, p_value):
+        """Appends the p-value of the next row."""
+        if p_value == p_value:
+            self.buffer[self.fill] = (p_value, self.rows)
+            self.fill += 1
+            self.tests += 1
+            if self.fill == self.capacity:
+                self.__spill__()
+        self.rows += 1
+
+    def __spill__(self):
+        """Writes the buffer to disk as a run sorted by descending p."""
+        run = np.sort(self.buffer[:self.fill], order=["p", "row"])[::-1]
+        path = os.path.join(self.directory, "run%d" % len(self.runs))
+        run.tofile(path)
+        self.runs.append((path, self.fill))
+        self.fill = 0
+
+    def qvalues(self):
+        """Returns the q-value of every row, in input order: an array when
+           no run was spilled, or else a memory-mapped one on disk."""
+        if not self.runs:
+            return self.__qvalues__()
+        if self.fill:
+            self.__spill__()
+        self.buffer = None # the runs' read buffers take its place.
+
+        path = os.path.join(self.directory, "qvalues")
+        Q = np.memmap(path, dtype="float64", mode="w+", shape=(self.rows,))
+        Q[:] = np.nan
+
+        chunk = max(1, self.capacity // len(self.runs))
+        records = heapq.merge(*[self.__read__(path, n, chunk)
+                                for path,n in self.runs])
+        m, q = float(self.tests), 1.0
+        ranks = xrange(self.tests, 0, -1)
+        for rank,(p,row) in itertools.izip(ranks, records):
+            q = min(q, -p * m / rank)
+            Q[row] = q
+        Q.flush()
+        return Q
+
+    def __qvalues__(self):
+        """In-memory q-values, when every p-value fit in the buffer."""
+        Q = np.empty(self.rows, dtype="float64")
+        Q.fill(np.nan)
+        records = np.sort(self.buffer[:self.fill], order=["p", "row"])
+        ranks = np.arange(1, self.fill + 1, dtype="float64")
+        q = records["p"] * float(self.tests) / ranks
+        q = np.minimum.accumulate(q[::-1])[::-1]
+        Q[records["row"]] = np.minimum(q, 1.0)
+        return Q
+
+    def __read__(self, path, n, chunk):
+        """Yields the (-p, row) records of a run, chunk by chunk."""
+        with open(path, "rb") as f:
+            for lo in xrange(0, n, chunk):
+                run = np.fromfile(f, dtype=RECORD, count=min(chunk, n - lo))
+                for record in zip((-run["p"]).tolist(), run["row"].tolist()):
+                    yield record
+
+    def close(self):
+        """Removes spilled runs, and with them the memory-mapped q-values."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def append_qvalues(finput, foutput, memory=64 * 2**20, directory=None,
+                   column=1):
+    """Copies tab-separated results from finput to foutput, adding a
+       q-value column computed from the p-values in the given column.
+       finput is read twice, so it must be seekable."""
+    spill = QValueSpill(memory, directory)
+    try:
+        header = finput.readline()
+        for line in finput:
+            spill.add(float(line.split("\t")[column]))
+        Q = spill.qvalues()
+
+        finput.seek(0)
+        finput.readline()
+        foutput.write(header.rstrip("\n") + "\tq-value\n")
+        for line,q in itertools.izip(finput, Q):
+            foutput.write(line.rstrip("\n") + "\t" + str(float(q)) + "\n")
+        del Q
+    finally:
+        spill.close()
+    return spill.rows
+
+if __name__ == "__main__":
+    print "This module computes q-values of p-value streams on disk."
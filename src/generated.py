@@ -14,6 +14,7 @@ class GeneratedDistribution:
         self.N = 25000
         if "N" in kwargs.keys():
             self.N = kwargs["N"]
+        self.batch = kwargs.get("batch", 1000)
 
         self.references = {}
         self.scores = {}
@@ -23,26 +24,30 @@ class GeneratedDistribution:
         self.scores[period] = self.__make_scores__(period)
 
     def __make_scores__(self, period):
-        series = self.__make_series__(period)
+        """Scores random series in batches, as a (batch x pairs) sign
+           matrix times the reference tau vector. Returned sorted."""
+        r = s._tau_vector(self.references[period])
         scores = np.zeros(self.N)
 
-        reference = self.references[period]
-        for i in xrange(series.shape[0]):
-            test = series[i,:]
-            scores[i] = s.k_score(reference, test)
+        for lo in xrange(0, self.N, self.batch):
+            hi = min(lo + self.batch, self.N)
+            series = self.__make_series__(period, hi - lo)
+            scores[lo:hi] = s._k_matrix(s._tau_matrix(series), r)
 
-        return np.abs(scores)
+        return np.sort(np.abs(scores))
 
-    def __make_series__(self, period):
+    def __make_series__(self, period, count=None):
         n = self.references[period].size
-        return np.random.random((self.N, n))
+        return np.random.random((count or self.N, n))
 
     def p_value(self, S, **kwargs):
+        """Fraction of null scores at least |S|; S scalar or array."""
         try:
             period = kwargs["period"]
         except:
             raise Exception("Must specify period for Monte Carlo distributions.")
-        leqs = np.sum(np.ones(self.N)[self.scores[period] >= np.abs(S)])
+        below = np.searchsorted(self.scores[period], np.abs(S), 'left')
+        leqs = self.N - below
         return leqs / float(self.N)
     
 if __name__ == "__main__":
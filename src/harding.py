@@ -6,15 +6,38 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
 import numpy as np
 
+# bump whenever the cdf construction changes, invalidating cached copies.
+CACHE_VERSION = "2"
+
 class HardingDistribution:
     """Class representing an exact statistic distribution for Kendall's
        Tau. Builds cumulative distribution function on initializations
        for reference when method p-value invoked."""
     
-    def __init__(self, times):
-        """Initialize with time-point replication array."""
-        self.max_score = self._compute_max_score(times)
-        self.cdf = self._build_cdf(times)
+    def __init__(self, times, **kwargs):
+        """Initialize with time-point replication array. Opt. cache is a
+           DistributionCache holding previously built distributions."""
+        cache = kwargs.get("cache", None)
+        if cache is None:
+            self.max_score = self._compute_max_score(times)
+            self.cdf = self._build_cdf(times)
+        else:
+            self._load_or_build(times, cache)
+
+    def _load_or_build(self, times, cache):
+        """Memory-maps a cached cdf for this design, building on a miss."""
+        design = sorted(int(t) for t in times)
+        key = cache.key("harding", CACHE_VERSION, design)
+
+        entry = cache.load(key)
+        if entry is None:
+            self.max_score = self._compute_max_score(times)
+            self.cdf = self._build_cdf(times)
+            meta = {"max_score": self.max_score, "reps": design}
+            cache.store(key, self.cdf, meta)
+        else:
+            self.cdf, meta = entry
+            self.max_score = meta["max_score"]
         
     def _compute_max_score(self, times):
         """Maximum score possible for total concordance."""
@@ -31,7 +54,7 @@ class HardingDistribution:
         icf = np.array(cdf[::-1], dtype='float')
         hcf = (icf[:-1] + icf[1:]) / 2
         
-        cf = np.zeros(1 + 2*self.max_score, dtype='float')
+        cf = np.zeros(int(1 + 2*self.max_score), dtype='float')
         cf[0::2] = icf
         cf[1::2] = hcf
         
@@ -39,9 +62,13 @@ class HardingDistribution:
         return cp
     
     def _build_lcdf(self, times):
-        """Harding algorithm to produce lower half of score distribution."""
+        """Harding algorithm to produce lower half of score distribution.
+           Coefficients are multiplied by (1 - x^t) and divided by (1 - x^s)
+           as whole-array shifted differences and strided cumulative sums,
+           rescaling by powers of two as it goes to avoid overflow."""
         mode = int(self.max_score / 2)
         cf = np.ones(mode + 1, dtype='float')
+        work = np.zeros(2 * (mode + 1), dtype='float')
         
         size = map(int,sorted(times))
         k = len(times)
@@ -60,17 +87,40 @@ class HardingDistribution:
                 p = min(m + n, mode)
                 factor = np.sign(p - (n+1)) or -1
                 for t in range(n+1, p+factor, factor):
-                    for u in range(mode, t-1, -1):
-                        cf[u] = cf[u] - cf[u-t]
+                    self._multiply(cf, t, work)
             
             q = int(min(m, mode))
             for s in range(1,q+1):
-                for u in range(s, mode+1):
-                    cf[u] = cf[u] + cf[u-s]
+                self._divide(cf, s, work)
+            
+            # exact rescaling; the cdf is normalized by cf[0] in the end.
+            _,exponent = np.frexp(cf[-1])
+            cf = np.ldexp(cf, -exponent)
         
         lcdf = cf
         return lcdf
     
+    def _multiply(self, cf, t, work):
+        """In-place truncated product of coefficients with (1 - x^t)."""
+        if t >= len(cf):
+            return
+        shifted = work[t:len(cf)]
+        np.subtract(cf[t:], cf[:-t], out=shifted)
+        cf[t:] = shifted
+    
+    def _divide(self, cf, s, work):
+        """In-place truncated quotient of coefficients by (1 - x^s), i.e. a
+           cumulative sum along each residue class modulo s."""
+        n = len(cf)
+        rows = -(-n // s)
+        strided = work[:rows * s]
+        strided[:n] = cf
+        strided[n:] = 0.0
+        
+        strided = strided.reshape(rows, s)
+        np.cumsum(strided, axis=0, out=strided)
+        cf[:] = strided.ravel()[:n]
+    
     def _build_ucdf(self, lcdf):
         """Builds symmetric upper-half cumulative distribution to c.f."""
         midx = int(self.max_score / 2)
@@ -89,17 +139,19 @@ class HardingDistribution:
         return ucdf
     
     def p_value(self, S, **kwargs):
-        """Publically invoked method, returns a p-value for a given Score."""
-        if not S:
-            p = 1.0
-        else:
-            M = self.max_score
-            score = (np.absolute(S) + M) / 2.0
-            
-            # score based index in upper-half of cdf array.
-            idx = int(2 * score)
-            p = 2 * self.cdf[idx]
-        return p
+        """Publically invoked method, returns a p-value for a given Score.
+           S may also be an array of scores, giving an array of p-values."""
+        if S is None:
+            return 1.0
+        
+        M = self.max_score
+        S = np.asarray(S, dtype='float')
+        score = (np.absolute(S) + M) / 2.0
+        
+        # score based index in upper-half of cdf array.
+        idx = (2 * score).astype('int')
+        p = np.where(S == 0, 1.0, 2 * self.cdf[idx])
+        return p[()]
 
 if __name__ == "__main__":
     print "This is a jtk-cycle exact null distribution module."
@@ -5,7 +5,7 @@ import os.path
 sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
 import numpy as np
-from reference import Reference
+from reference import ReferenceBlock
 import statistic
 
 class JTKCycle:
@@ -22,27 +22,50 @@ class JTKCycle:
         self.__function__ = kwargs.get("function", np.cos)
         self.__symmetry__ = kwargs.get("symmetry", True)
 
+        # long series are scored by sorting instead of pairwise tau vectors.
+        threshold = kwargs.get("threshold", statistic.SORTED_THRESHOLD)
+        self.sorted = np.sum(reps) > threshold
+
+        # opt-in instrumentation of hot paths.
+        self.profiler = kwargs.get("profiler", None)
+
         # initialize empty memoization caches
+        self.__block__ = None
         self.references = {}
         self.results = {}
         self.best = None # (offset, k_score)
         
     def __expand__(self, values):
-        """Provides replication of time-series based on repetitions array."""
-        pairs = zip(values, self.reps)
-        comps = tuple([value * np.ones(times) for value,times in pairs])
-        return np.concatenate(comps)
+        """Provides replication of time-series based on repetitions array.
+           Replicates the last axis, so blocks of series expand row-wise."""
+        reps = np.array(self.reps, dtype='int')
+        return np.repeat(np.array(values, dtype='float'), reps, axis=-1)
     
     def __run__(self, q, reference):
-        """Tests a single series against a child reference."""
-        if reference.tau_vector == None:
+        """Tests a single series against a child reference. In sorted mode
+           q is the raw series rather than its tau vector."""
+        if self.sorted:
+            r = self.__expand__(reference.series)
+            return statistic.sorted_k_score(q, r)
+
+        r = self.tau_vector(reference)
+
+        k_score = statistic._dot(q, r)
+        return k_score
+
+    def tau_vector(self, reference):
+        """Memoized tau vector of the replicate-expanded reference. Only
+           building it on a miss is timed, as "reference_tau"."""
+        if reference.tau_vector is None:
+            profiler = self.profiler
+            if profiler is not None:
+                start = profiler.clock()
             reference.tau_vector = statistic._tau_vector(
                 self.__expand__(reference.series)
                 )
-        r = reference.tau_vector
-
-        k_score = np.sum(q * r)
-        return k_score
+            if profiler is not None:
+                profiler.add("reference_tau", profiler.clock() - start)
+        return reference.tau_vector
     
     def run(self, q):
         """Populates the results dictionary. Returns the best-result."""
@@ -59,18 +82,40 @@ class JTKCycle:
 
         return self.best
     
+    def offsets(self):
+        """Offsets of the reference library, in generation order."""
+        return np.arange(0, self.period, self.density)
+
+    def block(self):
+        """Memoized array-backed references over every offset, built with
+           one waveform evaluation and one ranking pass."""
+        if self.__block__ is None:
+            self.__block__ = ReferenceBlock(self.timepoints,
+                                            self.period,
+                                            self.offsets(),
+                                            function=self.__function__,
+                                            symmetry=self.__symmetry__)
+        return self.__block__
+
     def generate_references(self):
         """Generates the entire reference library."""
-        for offset in np.arange(0, self.period, self.density):
+        profiler = self.profiler
+        for i,offset in enumerate(self.offsets()):
             try:
-                yield self.references[offset]
-            except:
-                self.references[offset] = Reference(self.timepoints,
-                                                    self.period,
-                                                    offset,
-                                                    function=self.__function__,
-                                                    symmetry=self.__symmetry__)
-                yield self.references[offset]
+                reference = self.references[offset]
+            except KeyError:
+                if profiler is not None:
+                    start = profiler.clock()
+                reference = self.block().reference(i)
+                self.references[offset] = reference
+                if profiler is not None:
+                    profiler.add("generate_references",
+                                 profiler.clock() - start)
+                    profiler.count("references.miss")
+            else:
+                if profiler is not None:
+                    profiler.count("references.hit")
+            yield reference
     
 if __name__ == "__main__":
     print "This is a module for generating reference series."
@@ -0,0 +1,84 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import json
+import numpy as np
+import utility as u
+
+class ReferenceLibrary:
+    """Precomputed bundle of every period x offset reference of a design,
+       one row per reference: int8 tau vectors, or expanded reference
+       series when the design is scored by sorting. Carries the lag table
+       (period and offset per row) and the key describing the design, as
+       well as the deduplicated (pairs x unique references) matrix the
+       scoring engine multiplies by, with the index and sign of every
+       reference into it, so that it too is mapped rather than rebuilt."""
+
+    def __init__(self, matrix, periods, offsets, key, unique=None):
+        """Init w/: (references x pairs) matrix, lag table, design key, and
+           the (matrix, index, signs) of unique references, if bundled."""
+        self.matrix = matrix
+        self.periods = periods
+        self.offsets = offsets
+        self.key = key
+        self.unique = unique
+
+    def save(self, path):
+        """Writes an uncompressed .npz bundle, so members can be mapped."""
+        U, index, signs = self.unique
+        with open(path, "wb") as f:
+            np.savez(f,
+                     matrix=self.matrix,
+                     periods=self.periods,
+                     offsets=self.offsets,
+                     key=np.array(json.dumps(self.key, sort_keys=True)),
+                     unique=U,
+                     index=index,
+                     signs=signs)
+        return
+
+    def check(self, key):
+        """Raises ValueError unless built for the argued design key."""
+        expect = json.loads(json.dumps(key))
+        if expect != self.key:
+            raise ValueError("reference library was built for a different "
+                             "design: %s" % json.dumps(self.key, sort_keys=True))
+        return
+
+def build_library(test, key):
+    """Builds the library bundle from a JTKCycleRun's reference matrix."""
+    R, _ = test.generate_reference_matrix()
+    matrix = R.T
+    if not test.sorted:
+        matrix = matrix.astype('int8')
+    periods = test.__ref_periods__
+    offsets = test.__ref_offsets__
+    U, index, signs = test.generate_unique_matrix()
+    unique = (np.ascontiguousarray(U), index, signs)
+    return ReferenceLibrary(np.ascontiguousarray(matrix), periods, offsets,
+                            key, unique)
+
+def load_library(path):
+    """Loads a library bundle, memory-mapping its reference matrices.
+       Bundles built before unique references were stored have them
+       rebuilt by the run instead."""
+    bundle = np.load(path)
+    try:
+        periods = bundle["periods"]
+        offsets = bundle["offsets"]
+        key = json.loads(str(bundle["key"]))
+        unique = None
+        if "unique" in bundle.files:
+            unique = (None, bundle["index"], bundle["signs"])
+    finally:
+        bundle.close()
+    matrix = u.memmap_member(path, "matrix")
+    if unique is not None:
+        unique = (u.memmap_member(path, "unique"),) + unique[1:]
+    return ReferenceLibrary(matrix, periods, offsets, key, unique)
+
+if __name__ == "__main__":
+    print "This module bundles precomputed reference libraries."
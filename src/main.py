@@ -5,6 +5,7 @@ import os.path
 sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
 import numpy as np
+from collections import OrderedDict
 
 import utility as u
 from jtkcycle import JTKCycle
@@ -25,21 +26,75 @@ class JTKCycleRun:
         self.timepoints = np.array(timepoints,dtype='float')
         self.periods = periods
         self.density = density
+        self.__bonferroni__ = np.sum(periods)
 
         self.__function__ = kwargs.get("function", np.cos)
         self.__symmetry__ = kwargs.get("symmetry", True)
+        self.block_size = kwargs.get("block_size", 1024)
+        self.threshold = kwargs.get("threshold", statistic.SORTED_THRESHOLD)
+        self.sorted = np.sum(self.reps) > self.threshold
+        self.library = kwargs.get("library", None)
 
-        distribution = kwargs.get("distribution", "harding")
-        if distribution == "normal":
-            self.distribution = NormalDistribution(self.reps)
-        else:
-            self.distribution = HardingDistribution(self.reps)
+        # optional branch-and-bound search, skipping provably worse refs;
+        # rows whose best p-value exceeds the cutoff are only rejected.
+        self.prune = kwargs.get("prune", False)
+        self.cutoff = kwargs.get("cutoff", None)
+        self.visited = 0 # references visited: scored, reused or pruned.
+        self.scored = 0 # unique references scored.
+        self.pruned = 0
+
+        self.__distribution__ = kwargs.get("distribution", "harding")
+        self.__cache__ = kwargs.get("cache", None)
+        self.distribution = self.__build_distribution__(self.reps)
 
         # initialize empty lookup table for test cycles and results.
         self.cycles = {}
         self.results = {}
         self.best = None
+        self.__matrix__ = None
+        self.__unique__ = None
+        self.__distances__ = None
+        self.__query__ = None
+
+        # reduced references and distributions per missingness pattern.
+        self.__patterns__ = OrderedDict()
+        self.__distributions__ = {}
+        self.__tables__ = {}
+        self.max_patterns = kwargs.get("max_patterns", 64)
 
+        # results of recent rank patterns, reused by rows sharing them;
+        # constant rows always share the one all-ties result.
+        self.memo_size = kwargs.get("memo", 0)
+        self.__memo__ = OrderedDict()
+        self.__constant__ = None
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.memo_constants = 0
+
+        # opt-in instrumentation of hot paths, including the tau vectors
+        # of the series scored.
+        self.__est_amp__ = u.est_amp
+        self.__tau_query__ = statistic.query
+        self.__tau_matrix__ = statistic._tau_matrix
+        self.profiler = kwargs.get("profiler", None)
+        if self.profiler is not None:
+            wrap = self.profiler.wrap
+            self.__tau_query__ = wrap("tau_vector", statistic.query)
+            self.__tau_matrix__ = wrap("tau_matrix", statistic._tau_matrix)
+            self.run = wrap("run", self.run)
+            self.run_matrix = wrap("run_matrix", self.run_matrix)
+            self.__find_matches__ = wrap("find_matches",
+                                         self.__find_matches__)
+            self.__score_block__ = wrap("score_block", self.__score_block__)
+            self.__resolve_block__ = wrap("resolve_block",
+                                          self.__resolve_block__)
+            self.__est_amp__ = wrap("est_amp", u.est_amp)
+
+    def __build_distribution__(self, reps):
+        """Null distribution of the configured kind for a replicate design."""
+        if self.__distribution__ == "normal":
+            return NormalDistribution(reps)
+        return HardingDistribution(reps, cache=self.__cache__)
 
     def __find_best__(self, series, cycles, best_p):
         results = self.__find_matches__(cycles, best_p)
@@ -48,7 +103,7 @@ class JTKCycleRun:
         offset = np.average([r[1] for r in results])
         k_score = np.amin([r[2] for r in results])
         p_value = np.amax([r[3] for r in results])
-        est_amp = u.est_amp(series)
+        est_amp = self.__est_amp__(series)
 
         return (est_amp, period, offset, k_score, p_value)
     
@@ -57,9 +112,10 @@ class JTKCycleRun:
         results = []
         for cycle in cycles:
             period = cycle.period
-            p = lambda k: self.bonferroni_adjust(
-                self.distribution.p_value(k, period=period)
-                )
+            table = self.p_table(period)
+            p = lambda k: table[int(abs(k))]
+            if self.profiler is not None:
+                p = self.profiler.wrap("p_value", p)
 
             for offset in cycle.results.keys():
                 k_score = cycle.results[offset]
@@ -84,15 +140,39 @@ class JTKCycleRun:
         """Input series is run through JTK-CYCLE."""
         self.results = {} # clear previous run.
         self.best = None
-        best_cycles, best_p = [], 1.0
 
-        q = statistic._tau_vector(series)
+        x = np.array(series, dtype='float')
+        if self.library is not None or np.any(np.isnan(x)):
+            # precomputed and reduced references only exist in matrix form.
+            self.run_matrix([series])
+            return self.best
+
+        key = self.__rank_keys__(x[np.newaxis,:])[0]
+        memo = self.__recall__(key)
+        if memo is not None:
+            self.best, self.results = self.__reuse__(memo,
+                                                     self.__est_amp__(series))
+            return self.best
+
+        if self.prune:
+            self.run_pruned(series)
+        else:
+            self.__run_series__(series)
+        self.__remember__(key, self.best, self.results)
+        return self.best
+
+    def __run_series__(self, series):
+        """Runs a complete series through every cycle, row by row."""
+        best_cycles, best_p = [], 1.0
+        q = self.__tau_query__(series, self.threshold, out=self.__query__)
+        self.__query__ = q
 
         for cycle in self.generate_jtk_cycles():
             period = cycle.period
-            p = lambda k: self.bonferroni_adjust(
-                self.distribution.p_value(k, period=period)
-                )
+            table = self.p_table(period)
+            p = lambda k: table[int(abs(k))]
+            if self.profiler is not None:
+                p = self.profiler.wrap("p_value", p)
 
             offset, k_score = cycle.run(q)
             p_value = p(k_score)
@@ -101,11 +181,16 @@ class JTKCycleRun:
                 best_p = p_value
             self.results[period] = (offset, k_score, p_value)
 
+        if not self.passes(best_p):
+            self.best = self.__rejected__(best_p)
+            return self.best
+
         for cycle in self.generate_jtk_cycles():
             period = cycle.period
-            p = lambda k: self.bonferroni_adjust(
-                self.distribution.p_value(k, period=period)
-                )
+            table = self.p_table(period)
+            p = lambda k: table[int(abs(k))]
+            if self.profiler is not None:
+                p = self.profiler.wrap("p_value", p)
 
             k_score = cycle.best[1]
             p_value = p(k_score)
@@ -115,27 +200,517 @@ class JTKCycleRun:
         self.best = self.__find_best__(series, best_cycles, best_p)
         return self.best
 
+    def passes(self, p_value):
+        """Whether a best p-value passes the cutoff, if one was argued."""
+        if self.cutoff is None:
+            return np.ones(np.shape(p_value), dtype='bool')
+        return np.asarray(p_value) <= self.cutoff
+
+    def __rejected__(self, best_p):
+        """Best result of a row failing the cutoff: only its p-value, with
+           neither tie-gathering nor amplitude estimation done."""
+        return (np.nan, np.nan, np.nan, np.nan, best_p)
+
+    def __rank_keys__(self, X):
+        """Memo keys of the rows of a block. Every k-score depends only on
+           a row's dense rank pattern, which keys complete rows; constant
+           rows share the key "constant". Rows with missing values, and all
+           non-constant rows when the memo is off, get None."""
+        keys = [None] * X.shape[0]
+        complete = ~np.any(np.isnan(X), axis=1)
+        constant = complete & (np.amax(X, axis=1) == np.amin(X, axis=1))
+        if self.memo_size:
+            rows = np.arange(X.shape[0])[:,np.newaxis]
+            order = np.argsort(X, axis=1, kind='mergesort')
+            sorts = X[rows,order]
+            steps = np.zeros(X.shape, dtype='int32')
+            steps[:,1:] = sorts[:,1:] != sorts[:,:-1]
+            ranks = np.empty(X.shape, dtype='int32')
+            ranks[rows,order] = np.cumsum(steps, axis=1)
+            for i in np.flatnonzero(complete):
+                keys[i] = ranks[i].tostring()
+        for i in np.flatnonzero(constant):
+            keys[i] = "constant"
+        return keys
+
+    def __recall__(self, key):
+        """Remembered (best, results) for a memo key, or None. Rows without
+           a key count as misses."""
+        if key is None:
+            memo = None
+        elif key == "constant":
+            memo = self.__constant__
+        else:
+            memo = self.__memo__.pop(key, None)
+            if memo is not None:
+                self.__memo__[key] = memo # most recently used.
+        self.__tally__(key, memo is not None)
+        return memo
+
+    def __tally__(self, key, hit, n=1):
+        """Counts n memo lookups as hits, constant rows, or misses."""
+        if not hit:
+            self.memo_misses += n
+            counter = "memo.miss"
+        elif key == "constant":
+            self.memo_constants += n
+            counter = "memo.constant"
+        else:
+            self.memo_hits += n
+            counter = "memo.hit"
+        if self.profiler is not None:
+            self.profiler.count(counter, n)
+
+    def __remember__(self, key, best, results):
+        """Stores a row's results under its memo key, evicting the least
+           recently used pattern once the memo is full."""
+        if key is None:
+            return
+        if key == "constant":
+            self.__constant__ = (best, results)
+            return
+        if len(self.__memo__) >= self.memo_size:
+            self.__memo__.popitem(last=False)
+        self.__memo__[key] = (best, results)
+
+    def __reuse__(self, memo, est_amp):
+        """Remembered results with the row's own amplitude estimate."""
+        best, results = memo
+        if not self.passes(best[-1]):
+            return best, dict(results)
+        return (est_amp,) + best[1:], dict(results)
+
+    def run_pruned(self, series):
+        """Input series is run through JTK-CYCLE, skipping references whose
+           k-score provably cannot reach the best p-value found so far (or
+           the cutoff, when one was argued). Since |k_j| <= |k_i| + D[i,j]
+           for the L1 distance D between reference tau vectors, each scored
+           reference bounds every other. Best results match the exhaustive
+           search; rows whose p-value exceeds the cutoff keep that verdict
+           but not exact values, and per-period results only cover scored
+           references."""
+        R, spans = self.generate_reference_matrix()
+        U, index, signs = self.generate_unique_matrix()
+        D = self.generate_distances()
+
+        x = np.array(series, dtype='float')
+        if self.sorted:
+            score = lambda j: statistic.sorted_k_score(x, U[:,j])
+        else:
+            q = self.__tau_query__(x, self.threshold)
+            score = lambda j: statistic._dot(q, U[:,j])
+
+        n = R.shape[1]
+        K = np.zeros((1,n), dtype='float')
+        P = np.empty((1,n), dtype='float')
+        P.fill(np.inf) # never matches the best p-value.
+
+        bounds = np.empty(n, dtype='float')
+        bounds.fill(self.distribution.max_score)
+        best_p = 1.0
+        scores = {}
+        for period,a,b,_ in spans:
+            table = self.p_table(period)
+            for j in xrange(a, b):
+                self.visited += 1
+                limit = best_p if self.cutoff is None else min(best_p,
+                                                               self.cutoff)
+                if table[int(bounds[j])] > limit:
+                    self.pruned += 1
+                    continue
+
+                c = index[j]
+                if c not in scores:
+                    scores[c] = score(c)
+                    self.scored += 1
+                k_score = signs[j] * scores[c] + 0.0
+                K[0,j], P[0,j] = k_score, table[int(abs(k_score))]
+
+                best_p = min(best_p, P[0,j])
+                bounds = np.minimum(bounds, abs(k_score) + D[j])
+
+        est_amps = [np.nan]
+        if self.passes(best_p):
+            est_amps = [self.__est_amp__(series)]
+        bests, results = self.__resolve_block__(K, P, est_amps, spans)
+        self.best, self.results = bests[0], results[0]
+        return self.best
+
+    def run_matrix(self, X):
+        """Input block of series (one per row) is run through JTK-CYCLE.
+           Returns lists of best results and per-period results, one entry
+           per row, identical to what run would produce row by row."""
+        X = np.array(X, dtype='float', ndmin=2)
+        bests, results = [], []
+        for lo in xrange(0, X.shape[0], self.block_size):
+            block_bests, block_results = self.__run_memo_block__(
+                X[lo:lo+self.block_size]
+                )
+            bests.extend(block_bests)
+            results.extend(block_results)
+
+        if bests:
+            self.best, self.results = bests[-1], results[-1]
+        return bests, results
+
+    def __run_memo_block__(self, X):
+        """Runs a block, scoring only rows whose rank pattern is neither
+           remembered nor repeated earlier in the block."""
+        keys = self.__rank_keys__(X)
+        if not any(keys):
+            self.__tally__(None, False, len(keys))
+            return self.__run_block__(X)
+
+        n = X.shape[0]
+        bests, results = [None] * n, [None] * n
+        todo, first, reused = [], {}, []
+        for i,key in enumerate(keys):
+            if key is not None and key in first:
+                self.__tally__(key, True)
+                reused.append((i, first[key]))
+                continue
+            memo = self.__recall__(key)
+            if memo is not None:
+                reused.append((i, memo))
+                continue
+            if key is not None:
+                first[key] = i
+            todo.append(i)
+
+        if todo:
+            block_bests, block_results = self.__run_block__(X[todo])
+            for i,best,result in zip(todo, block_bests, block_results):
+                bests[i], results[i] = best, result
+                self.__remember__(keys[i], best, result)
+
+        if reused:
+            rows = [i for i,_ in reused]
+            est_amps = self.__est_amp__(X[rows].T)
+            for (i,memo),est_amp in zip(reused, est_amps):
+                if not isinstance(memo, tuple):
+                    memo = (bests[memo], results[memo]) # repeated in block.
+                bests[i], results[i] = self.__reuse__(memo, est_amp)
+        return bests, results
+
+    def __run_block__(self, X):
+        """Scores a block against the whole reference library in a single
+           matrix multiply, then resolves best matches with array lookups.
+           Rows with missing values are scored in buckets sharing the same
+           missingness pattern, against reduced references and nulls."""
+        R, spans = self.generate_reference_matrix()
+        U, _, _ = self.generate_unique_matrix()
+        missing = np.isnan(X)
+        if not np.any(missing):
+            K, P = self.__score_block__(X, U, self.distribution, spans)
+            keep = self.passes(np.amin(P, axis=1))
+            if np.all(keep):
+                est_amps = self.__est_amp__(X.T)
+            else:
+                est_amps = np.empty(X.shape[0], dtype='float')
+                est_amps.fill(np.nan)
+                if np.any(keep):
+                    est_amps[keep] = self.__est_amp__(X[keep].T)
+            return self.__resolve_block__(K, P, est_amps, spans)
+
+        K = np.zeros((X.shape[0], R.shape[1]), dtype='float')
+        P = np.ones((X.shape[0], R.shape[1]), dtype='float')
+        est_amps = np.zeros(X.shape[0], dtype='float')
+
+        buckets = {}
+        for i in xrange(X.shape[0]):
+            buckets.setdefault(missing[i].tostring(), []).append(i)
+
+        for key,rows in buckets.iteritems():
+            present = ~missing[rows[0]]
+            Z = X[rows][:,present]
+            if Z.shape[1] == 0:
+                est_amps[rows] = np.nan
+                continue
+
+            est_amps[rows] = self.__est_amp__(Z.T)
+            if Z.shape[1] < 2:
+                continue # no pairs: zero scores, unit p-values.
+
+            if np.all(present):
+                Uz, distribution = U, self.distribution
+            else:
+                Uz, distribution = self.__reduce__(key, present)
+            K[rows], P[rows] = self.__score_block__(Z, Uz, distribution, spans)
+        return self.__resolve_block__(K, P, est_amps, spans)
+
+    def __reduce__(self, key, present):
+        """Memoized unique references restricted to pairs of present
+           samples, and the null distribution of the correspondingly
+           reduced design."""
+        try:
+            return self.__patterns__[key]
+        except KeyError:
+            pass
+
+        U, _, _ = self.generate_unique_matrix()
+        if self.sorted:
+            Uz = U[present,:]
+        else:
+            xs,ys = statistic._tril_indices(len(present))
+            Uz = U[present[xs] & present[ys],:]
+
+        groups = np.repeat(np.arange(len(self.reps)), self.reps.astype('int'))
+        counts = np.bincount(groups[present], minlength=len(self.reps))
+        design = tuple(sorted(counts[counts > 0]))
+        if design not in self.__distributions__:
+            self.__distributions__[design] = self.__build_distribution__(
+                np.array(design, dtype='float')
+                )
+
+        if len(self.__patterns__) >= self.max_patterns:
+            self.__patterns__.popitem(last=False)
+        self.__patterns__[key] = (Uz, self.__distributions__[design])
+        return self.__patterns__[key]
+
+    def __score_block__(self, X, U, distribution, spans):
+        """Scores and adjusted p-values of a block against references,
+           scoring each unique reference once and fanning it back out."""
+        if self.sorted:
+            K = statistic.sorted_k_matrix(X, U)
+        else:
+            K = statistic._k_matrix(self.__tau_matrix__(X), U)
+
+        _, index, signs = self.generate_unique_matrix()
+        K = K[:,index]
+        K[:,signs < 0] *= -1
+        K += 0.0 # no negative zeros.
+
+        P = np.zeros(K.shape, dtype='float')
+        for period,a,b,_ in spans:
+            table = self.p_table(period, distribution)
+            P[:,a:b] = table[np.abs(K[:,a:b]).astype('int')]
+        return K, P
+
+    def p_table(self, period, distribution=None):
+        """Memoized dense table mapping every attainable |k-score| of a
+           period to its final Bonferroni-adjusted p-value."""
+        distribution = distribution or self.distribution
+        tables = self.__tables__.setdefault(distribution, {})
+        try:
+            return tables[period]
+        except KeyError:
+            scores = np.arange(int(distribution.max_score) + 1)
+            tables[period] = self.bonferroni_adjust(
+                distribution.p_value(scores, period=period)
+                )
+            return tables[period]
+
+    def __resolve_block__(self, K, P, est_amps, spans):
+        """Resolves per-period and overall best matches of scored rows."""
+        rows = np.arange(K.shape[0])
+
+        # last offset of maximal |k| within each period, as in JTKCycle.run
+        results = [{} for i in rows]
+        for period,a,b,_ in spans:
+            js = b - 1 - np.argmax(np.abs(K[:,a:b])[:,::-1], axis=1)
+            for i,j in enumerate(js):
+                results[i][period] = (self.__offsets__[j], K[i,j], P[i,j])
+
+        best_p = np.amin(P, axis=1)
+        matches = (P == best_p[:,np.newaxis])
+        counts = np.sum(matches, axis=1)
+
+        js = np.argmax(matches, axis=1)
+        periods = self.__ref_periods__[js]
+        lags = self.__lag__(periods, self.__ref_offsets__[js], K[rows,js])
+        keep = self.passes(best_p)
+
+        bests = []
+        for i in rows:
+            if not keep[i]:
+                bests.append(self.__rejected__(best_p[i]))
+                continue
+            if counts[i] == 1:
+                j = js[i]
+                bests.append((est_amps[i], periods[i], lags[i],
+                              K[i,j], P[i,j]))
+                continue
+
+            # ties: gather matches in the same order as __find_matches__
+            tied = [(period, j) for period,a,b,order in spans
+                    for j in order if matches[i,j]]
+            ks = np.array([K[i,j] for _,j in tied])
+            ls = self.__lag__(self.__ref_periods__[[j for _,j in tied]],
+                              self.__ref_offsets__[[j for _,j in tied]],
+                              ks)
+            bests.append((est_amps[i],
+                          np.average([period for period,_ in tied]),
+                          np.average(list(ls)),
+                          np.amin(ks),
+                          np.amax([P[i,j] for _,j in tied])))
+        return bests, results
+
+    def __lag__(self, periods, offsets, k_scores):
+        """Vectorized modulo arithmetic giving the lag of each match."""
+        s = np.sign(k_scores)
+        s[s == 0] = 1
+        if self.__symmetry__:
+            return (periods + (1-s)*periods/4 - offsets/2) % periods
+        return ((2 * periods) - offsets) % periods
+
+    def generate_reference_matrix(self):
+        """Memoized (pairs x references) matrix stacking the tau vector of
+           every offset of every period, plus (period, start, stop, order)
+           column spans per period. Above the sorting threshold, columns
+           hold expanded reference series instead of tau vectors. Taken
+           from the precomputed library when one was argued."""
+        if self.__matrix__ is not None:
+            return self.__matrix__
+
+        offsets, periods, spans = [], [], []
+        for cycle in self.generate_jtk_cycles():
+            a = len(offsets)
+            order = {}
+            for offset in cycle.offsets():
+                order[offset] = len(offsets)
+                offsets.append(offset)
+                periods.append(cycle.period)
+            spans.append((cycle.period, a, len(offsets), order.values()))
+
+        self.__offsets__ = offsets
+        self.__ref_offsets__ = np.array(offsets, dtype='float')
+        self.__ref_periods__ = np.array(periods, dtype='float')
+
+        if self.library is not None:
+            R = self.__library_matrix__()
+        else:
+            blocks = []
+            for cycle in self.generate_jtk_cycles():
+                series = cycle.__expand__(cycle.block().series)
+                if cycle.sorted:
+                    blocks.append(series)
+                else:
+                    blocks.append(statistic._tau_matrix(series))
+            R = np.concatenate(blocks).T
+
+        self.__matrix__ = (R, spans)
+        return self.__matrix__
+
+    def generate_unique_matrix(self):
+        """Memoized (pairs x unique references) matrix keeping one column
+           per distinct tau pattern, along with the index of each reference
+           column into it and the sign (+1, -1) relating the two. Columns
+           with equal or negated rank patterns score equal or negated k.
+           Tau patterns are kept as float32, the operand of the BLAS
+           product. Mapped from the library when it bundles them."""
+        if self.__unique__ is not None:
+            return self.__unique__
+
+        R, _ = self.generate_reference_matrix()
+        if self.library is not None and self.library.unique is not None:
+            self.__unique__ = self.__library_unique__(R)
+            return self.__unique__
+
+        keys, columns = {}, []
+        index = np.zeros(R.shape[1], dtype='int')
+        signs = np.ones(R.shape[1], dtype='int8')
+        for j in xrange(R.shape[1]):
+            key, sign = self.__pattern__(R[:,j])
+            if key not in keys:
+                keys[key] = (len(columns), sign)
+                columns.append(j)
+            index[j], first = keys[key]
+            signs[j] = sign * first
+
+        U = R[:,columns]
+        if not self.sorted:
+            U = U.astype('float32')
+        self.__unique__ = (U, index, signs)
+        return self.__unique__
+
+    def generate_distances(self):
+        """Memoized (references x references) L1 distances between the tau
+           vectors of references: the number of pairs on which they differ,
+           counting opposite signs twice."""
+        if self.__distances__ is not None:
+            return self.__distances__
+
+        R, _ = self.generate_reference_matrix()
+        T = statistic._tau_matrix(R.T) if self.sorted else R.T
+        up = (T > 0).astype('float')
+        down = (T < 0).astype('float')
+        counts = np.sum(T != 0, axis=1)
+
+        same = np.dot(up, up.T) + np.dot(down, down.T)
+        self.__distances__ = counts[:,np.newaxis] + counts - 2 * same
+        return self.__distances__
+
+    def __pattern__(self, column):
+        """Hashable key shared by a reference column and its negation, and
+           the sign taking the column to the canonical form of the key."""
+        if self.sorted:
+            ranks = np.unique(column, return_inverse=True)[1]
+            flipped = ranks.max() - ranks if len(ranks) else ranks
+            up, down = ranks.tostring(), flipped.tostring()
+            return (up, 1) if up <= down else (down, -1)
+
+        nonzero = np.flatnonzero(column)
+        if len(nonzero) == 0 or column[nonzero[0]] > 0:
+            return np.ascontiguousarray(column, dtype='int8').tostring(), 1
+        return np.ascontiguousarray(-column, dtype='int8').tostring(), -1
+
+    def __library_matrix__(self):
+        """Checks the library lag table against this run's references and
+           hands back its (memory-mapped) matrix as pairs x references."""
+        library = self.library
+        n = int(np.sum(self.reps))
+        width = n if self.sorted else n * (n - 1) / 2
+
+        same = (library.matrix.shape == (len(self.__offsets__), width)
+                and np.all(library.periods == self.__ref_periods__)
+                and np.all(library.offsets == self.__ref_offsets__))
+        if not same:
+            raise ValueError("reference library does not match this run.")
+        return library.matrix.T
+
+    def __library_unique__(self, R):
+        """Checks the library's unique references against its reference
+           matrix and hands them back, still memory-mapped."""
+        U, index, signs = self.library.unique
+        dtype = np.dtype(R.dtype if self.sorted else 'float32')
+        same = (U.shape[0] == R.shape[0] and U.dtype == dtype
+                and index.shape == signs.shape == (R.shape[1],)
+                and np.all(index < U.shape[1]))
+        if not same:
+            raise ValueError("reference library does not match this run.")
+        return (U, index, signs)
+
     def generate_jtk_cycles(self):
         """Lazy instantiation generator for building a memoized hash
            of reference cycle instances. One for each period to check."""
         for period in self.periods:
             try:
-                yield self.cycles[period]
-            except:
+                cycle = self.cycles[period]
+            except KeyError:
                 cycle = JTKCycle(
                     period,
                     self.reps,
                     self.timepoints,
                     self.density,
                     function=self.__function__,
-                    symmetry=self.__symmetry__
+                    symmetry=self.__symmetry__,
+                    threshold=self.threshold,
+                    profiler=self.profiler
                     )
                 self.cycles[period] = cycle
-                yield self.cycles[period]
+                if self.profiler is not None:
+                    self.profiler.count("cycles.miss")
+            else:
+                if self.profiler is not None:
+                    self.profiler.count("cycles.hit")
+            yield cycle
 
     def bonferroni_adjust(self, p_value):
-        """Applies test-specific bonferroni correction to a p-value."""
-        n = np.sum(self.periods)
+        """Applies test-specific bonferroni correction to a p-value, or
+           elementwise to an array of p-values."""
+        n = self.__bonferroni__
+        if np.ndim(p_value):
+            return np.minimum(1.0, n * p_value)
         return min(1.0, n * p_value)
 
 if __name__ == "__main__":
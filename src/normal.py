@@ -30,11 +30,13 @@ class NormalDistribution:
         return sdv
     
     def p_value(self, S, **kwargs):
-        """Public handle for generating a p-value from a tau score S."""
-        if not S:
+        """Public handle for generating a p-value from a tau score S.
+           S may also be an array of scores, giving an array of p-values."""
+        if S is None:
             return 1.0
         
         M = self.max_score
+        S = np.asarray(S, dtype='float')
         score = (np.absolute(S) + M) / 2.0
         
         a = -1.0 * (score - 0.5)
@@ -43,9 +45,8 @@ class NormalDistribution:
         num = np.abs(a - b)
         den = self.stdev * np.sqrt(2)
         
-        normal_cdf = lambda x: 1.0 - u.erf(x)
-        p = normal_cdf(num / den)
-        return p
+        p = np.where(S == 0, 1.0, u.erfc(num / den))
+        return p[()]
 
 if __name__ == "__main__":
     print "This is a jtk-cycle null distribution normal-approximation module."
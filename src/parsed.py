@@ -4,18 +4,32 @@ import sys
 import os.path
 sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
+import os
 import string
 import re
+import shutil
+import zipfile
+import tempfile
+import itertools
+import StringIO
 import numpy as np
+import utility as u
 
 class DataParser:
     """A parser class for reading microarray data and generating
        relevant specification."""
     
-    def __init__(self, f, should_repattern=False):
+    def __init__(self, f, should_repattern=False, block_size=4096):
         self.file = f
+        self.block_size = block_size
         header = f.readline()
         times = self.parse_header(header)
+        self.header = header.rstrip("\r\n")
+
+        # byte offset just past the last line handed out in a block, and
+        # the offset at which this parser's rows stop (None: end of file).
+        self.offset = len(header)
+        self.end = None
         
         # These are arguments to JTKCycleRun initialization...
         self.reps       = self.get_reps(times)
@@ -24,6 +38,9 @@ class DataParser:
         # This enables correct concatenation.
         self.should_repattern = should_repattern
         self.pattern = self.build_pattern(times)
+        self.permutation = np.array(
+            [i for t,indices in self.pattern for i in indices], dtype='int'
+            )
     
     def parse_header(self, header):
         words = string.split(header)
@@ -71,14 +88,100 @@ class DataParser:
         return repatterned
     
     def generate_series(self):
-        for line in self.file:
-            words = string.split(line)
+        for names,values in self.generate_blocks():
+            for name,series in zip(names, values):
+                yield (name, series)
+    
+    def generate_blocks(self, size=None):
+        """Yields (names, values) blocks of up to size rows, where values is
+           a (rows x samples) float array converted in bulk, missing (NA or
+           blank) cells are nan, and repatterning is a single index
+           permutation. Cells are tab-delimited; rows without a tab are
+           split on whitespace."""
+        size = size or self.block_size
+        while self.end is None or self.offset < self.end:
+            lines = list(itertools.islice(self.file, size))
+            if self.end is not None:
+                lines = self.__clip__(lines)
+            if not lines:
+                return
+            self.offset += sum([len(line) for line in lines])
+            
+            words = [self.__split__(line) for line in lines if line.strip()]
+            if not words:
+                continue
             
-            name = words[0]
-            values = map(self.floatify, words[1:])
+            names = [w[0].strip() for w in words]
+            values = self.bulk_floatify([w[1] if len(w) > 1 else ""
+                                         for w in words])
+            if values.shape[1] != self.permutation.size:
+                raise ValueError(
+                    "rows have %d values for %d samples in the header; "
+                    "input must be tab-delimited"
+                    % (values.shape[1], self.permutation.size))
             if self.should_repattern:
-                values = self.repattern(values)
-            yield (name, values)
+                values = values[:,self.permutation]
+            yield (names, values)
+    
+    def __split__(self, line):
+        """Splits a row into its name and its tab-delimited values. A row
+           with no tab is split on whitespace instead."""
+        line = line.rstrip("\r\n")
+        if "\t" in line:
+            return line.split("\t", 1)
+        words = line.split()
+        return [words[0], "\t".join(words[1:])]
+    
+    def __clip__(self, lines):
+        """Lines starting before the end offset."""
+        offset = self.offset
+        for i,line in enumerate(lines):
+            if offset >= self.end:
+                return lines[:i]
+            offset += len(line)
+        return lines
+
+    def shard(self, i, n):
+        """Restricts reading to the i-th of n equal byte ranges of the rows
+           past the header (0 <= i < n). A row belongs to the range holding
+           its first byte, so shards split on line boundaries without
+           scanning the file. Returns the (lo, hi) byte range."""
+        size = os.fstat(self.file.fileno()).st_size
+        start = self.offset
+        lo = start + (size - start) * i // n
+        hi = start + (size - start) * (i + 1) // n
+
+        offset = lo
+        if lo > start:
+            # skip the tail of a row begun in the previous range.
+            self.file.seek(lo - 1)
+            if self.file.read(1) != "\n":
+                offset += len(self.file.readline())
+        self.seek(offset)
+        self.end = hi
+        return (lo, hi)
+
+    def seek(self, offset):
+        """Continues reading rows from a byte offset past the header, as
+           recorded in offset. Only valid before any block was read."""
+        self.file.seek(offset)
+        self.offset = offset
+
+    def bulk_floatify(self, rows):
+        """Converts tab-delimited value strings into a float array, in a
+           single C-level pass unless some cell is not a number."""
+        cells = [row.split("\t") for row in rows]
+        counts = [len(row) for row in cells]
+        if min(counts) != max(counts):
+            raise ValueError("rows have differing numbers of values")
+        
+        values = np.fromstring(" ".join(rows), dtype='float', sep=" ")
+        if values.size != sum(counts):
+            # some cell did not parse; redo cell by cell with NA and blank
+            # cells as nan.
+            words = [map(self.floatify, row) for row in cells]
+            values = np.array(words, dtype='float')
+        return values.reshape(len(rows), counts[0])
     
     def floatify(self, astring):
         try:
@@ -86,5 +189,90 @@ class DataParser:
         except:
             return None
     
+class BundleParser:
+    """Parser interface over a binary bundle written by convert_bundle.
+       The value matrix is memory-mapped, already in repatterned order."""
+    
+    def __init__(self, path, block_size=4096):
+        self.path = path
+        self.block_size = block_size
+        
+        bundle = np.load(path)
+        try:
+            self.names = bundle["names"]
+            self.reps = [int(r) for r in bundle["reps"]]
+            self.timepoints = [float(t) for t in bundle["timepoints"]]
+        finally:
+            bundle.close()
+        self.values = u.memmap_member(path, "values")
+        self.start, self.stop = 0, self.values.shape[0]
+    
+    def shard(self, i, n):
+        """Restricts reading to the i-th of n equal row ranges (0 <= i < n).
+           Returns the (lo, hi) row range."""
+        rows = self.values.shape[0]
+        self.start, self.stop = rows * i // n, rows * (i + 1) // n
+        return (self.start, self.stop)
+    
+    def generate_series(self):
+        for names,values in self.generate_blocks():
+            for name,series in zip(names, values):
+                yield (name, series)
+    
+    def generate_blocks(self, size=None):
+        """Yields (names, values) blocks of up to size rows."""
+        for lo,hi in self.generate_ranges(size):
+            yield self.block(lo, hi)
+    
+    def generate_ranges(self, size=None):
+        """Yields (lo, hi) row ranges of up to size rows."""
+        size = size or self.block_size
+        for lo in xrange(self.start, self.stop, size):
+            yield (lo, min(lo + size, self.stop))
+    
+    def block(self, lo, hi):
+        """Names and float values of rows lo through hi."""
+        names = [str(name) for name in self.names[lo:hi]]
+        return (names, np.array(self.values[lo:hi], dtype='float'))
+    
+def convert_bundle(parser, path, dtype='float'):
+    """Streams a DataParser's rows, repatterned by ZT, into a binary .npz
+       bundle of values, names, reps and timepoints. Values are staged on
+       disk, so memory use is bounded by the parser's block size."""
+    parser.should_repattern = True
+    directory = os.path.dirname(os.path.abspath(path))
+    raw = tempfile.TemporaryFile(dir=directory)
+    staged = tempfile.NamedTemporaryFile(dir=directory, suffix=".npy",
+                                         delete=False)
+    try:
+        names, rows, cols = [], 0, len(parser.permutation)
+        for block_names,values in parser.generate_blocks():
+            names.extend(block_names)
+            rows += values.shape[0]
+            cols = values.shape[1]
+            values.astype(dtype).tofile(raw)
+        
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                  "fortran_order": False,
+                  "shape": (rows, cols)}
+        np.lib.format.write_array_header_1_0(staged, header)
+        raw.seek(0)
+        shutil.copyfileobj(raw, staged)
+        staged.close()
+        
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, True) as bundle:
+            bundle.write(staged.name, "values.npy")
+            for name,array in (("names", np.array(names, dtype='str')),
+                               ("reps", np.array(parser.reps)),
+                               ("timepoints", np.array(parser.timepoints))):
+                buf = StringIO.StringIO()
+                np.save(buf, array)
+                bundle.writestr(name + ".npy", buf.getvalue())
+    finally:
+        raw.close()
+        staged.close()
+        os.remove(staged.name)
+    return
+
 if __name__ == "__main__":
     print "This is a parser for handling microarray data."
@@ -0,0 +1,118 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import Queue
+import threading
+
+DONE = object() # end-of-stream marker passed down the queues.
+
+class Stage(threading.Thread):
+    """Daemon thread running one pipeline stage, keeping any exception it
+       raises so the caller can re-raise it after joining."""
+
+    def __init__(self, fn, *args):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.fn = fn
+        self.args = args
+        self.error = None
+
+    def run(self):
+        try:
+            self.fn(*self.args)
+        except BaseException:
+            self.error = sys.exc_info()
+
+    def check(self):
+        """Re-raises the exception of a failed stage in the caller."""
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+
+def run_pipeline(blocks, submit, write, depth=8, buffer_size=2**20):
+    """Streams blocks through three overlapping stages: a reader thread
+       pulling blocks from the iterable, the calling thread handing each
+       to submit, and a writer thread emitting the results in input order
+       through write, in chunks of at least buffer_size characters.
+       submit returns either the result text or a handle (such as a pool
+       AsyncResult) whose get() yields it. Queues hold at most depth
+       blocks, so a slow stage throttles the ones before it."""
+    reads = Queue.Queue(depth)
+    results = Queue.Queue(depth)
+    stop = threading.Event() # set by the writer on failure, or when done.
+
+    reader = Stage(__read__, blocks, reads, stop)
+    writer = Stage(__write__, results, write, buffer_size, stop)
+    reader.start()
+    writer.start()
+    try:
+        while not stop.is_set():
+            try:
+                block = reads.get(timeout=0.1)
+            except Queue.Empty:
+                if reader.is_alive() or not reads.empty():
+                    continue
+                break
+            if block is DONE:
+                break
+            results.put(submit(block))
+    finally:
+        stop.set()
+        results.put(DONE)
+        writer.join()
+        reader.join()
+    reader.check()
+    writer.check()
+
+def __read__(blocks, reads, stop):
+    """Reader stage: feeds blocks into the queue until exhausted or told
+       to stop, then marks the end of the stream."""
+    try:
+        for block in blocks:
+            if not __put__(reads, block, stop):
+                return
+    finally:
+        __put__(reads, DONE, stop)
+
+def __put__(queue, item, stop):
+    """Blocking put that gives up once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Queue.Full:
+            pass
+    return False
+
+def __write__(results, write, buffer_size, stop):
+    """Writer stage: resolves results in order and writes them in large
+       chunks. After a failure it stops the pipeline, but keeps draining so
+       the producer never blocks."""
+    chunks, size = [], 0
+    error = None
+    while True:
+        result = results.get()
+        if result is DONE:
+            break
+        if error is not None:
+            continue
+        try:
+            text = result.get() if hasattr(result, "get") else result
+            chunks.append(text)
+            size += len(text)
+            if size >= buffer_size:
+                write("".join(chunks))
+                chunks, size = [], 0
+        except BaseException:
+            error = sys.exc_info()
+            stop.set()
+
+    if error is not None:
+        raise error[0], error[1], error[2]
+    if chunks:
+        write("".join(chunks))
+
+if __name__ == "__main__":
+    print "This module streams blocks through threaded pipeline stages."
@@ -0,0 +1,60 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import json
+import timeit
+
+class Profiler:
+    """Opt-in accumulator of wall-clock totals and call counts per named
+       hot path, plus plain event counters (e.g. cache hits and misses).
+       Nothing is wrapped or counted unless a profiler is handed in."""
+
+    def __init__(self, clock=timeit.default_timer):
+        self.clock = clock
+        self.totals = {}
+        self.calls = {}
+        self.counts = {}
+
+    def add(self, name, seconds, calls=1):
+        """Accumulates time spent, and calls made, in a named path."""
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def count(self, name, n=1):
+        """Increments a named event counter."""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def wrap(self, name, fn):
+        """Returns fn timed and counted under name."""
+        clock, add = self.clock, self.add
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                add(name, clock() - start)
+        return timed
+
+    def report(self, rows):
+        """Totals and per-row averages as a JSON-serializable dict."""
+        per = lambda x: float(x) / rows if rows else None
+        timers = {}
+        for name in self.totals:
+            timers[name] = {
+                "calls": self.calls[name],
+                "seconds": self.totals[name],
+                "calls_per_row": per(self.calls[name]),
+                "seconds_per_row": per(self.totals[name]),
+                }
+        return {"rows": rows, "timers": timers, "counters": self.counts}
+
+    def dump(self, f, rows):
+        """Writes the report for rows scored as JSON to an open file."""
+        json.dump(self.report(rows), f, indent=2, sort_keys=True)
+        f.write("\n")
+
+if __name__ == "__main__":
+    print "Defines an opt-in profiler for timing JTK-CYCLE hot paths."
@@ -21,10 +21,15 @@ class Reference:
         self.__function__ = kwargs.get("function", np.cos)
         self.__symmetry__ = kwargs.get("symmetry", True)
 
-        self.__values__ = self.__build_values__(period, offset)
+        # values and ranks may be handed in from a ReferenceBlock.
+        self.__values__ = kwargs.get("values", None)
+        if self.__values__ is None:
+            self.__values__ = self.__build_values__(period, offset)
 
         # Public data handles.
-        self.series = self.__rank__(self.__values__)
+        self.series = kwargs.get("series", None)
+        if self.series is None:
+            self.series = self.__rank__(self.__values__)
         self.signs = np.sign(self.__values__)
         self.tau_vector = None
         
@@ -43,25 +48,74 @@ class Reference:
     
     def __rank__(self, data):
         """Fractional rank ordering of elements."""
-        rank = lambda v: sorted(range(len(v)), key=v.__getitem__)
-
-        n = len(data)
-        idxs=rank(data)
-        sorts=[data[idx] for idx in idxs]
-
-        sum_ranks = 0
-        n_ranked = 1
-        f_ranks = [0]*n
-        for i in xrange(n):
-            sum_ranks += i
-            n_ranked += 1
-            if i==n-1 or sorts[i] != sorts[i+1]:
-                avg_rank = sum_ranks / float(n_ranked)
-                for j in xrange(i-n_ranked+1,i+1):
-                    f_ranks[idxs[j]] = avg_rank
-                sum_ranks = 0
-                n_ranked = 0
-        return np.array(f_ranks, dtype='float') / float(n - 1)
-    
+        return fractional_ranks(data)[0]
+
+class ReferenceBlock:
+    """Array-backed references of a period over many offsets at once: one
+       row of values, ranked series and signs per offset. Rows match the
+       Reference instances of the same offsets exactly."""
+
+    def __init__(self, xs, period, offsets, **kwargs):
+        """Initializes references for every offset of a period."""
+        self.period = period
+        self.offsets = offsets
+
+        self.__xs__ = np.array(xs, dtype='float')
+        self.__function__ = kwargs.get("function", np.cos)
+        self.__symmetry__ = kwargs.get("symmetry", True)
+
+        self.values = self.__build_values__(period, offsets)
+        self.series = fractional_ranks(self.values)
+        self.signs = np.sign(self.values)
+
+    def __build_values__(self, period, offsets):
+        """Evaluates f over the whole offsets x xs grid in one call."""
+        f = self.__function__
+        pi = round(np.pi,4)
+        sf = 2. if self.__symmetry__ else 1.
+
+        time_to_angle = 2 * pi / period
+        dx = (np.array(offsets)[:,np.newaxis] * time_to_angle) / sf
+        xs = self.__xs__ * time_to_angle
+
+        values = np.array(f(xs + dx), dtype='float')
+        return values.reshape((len(offsets), len(xs)))
+
+    def reference(self, i):
+        """Reference instance of the i-th offset, sharing this block's rows."""
+        return Reference(self.__xs__, self.period, self.offsets[i],
+                         function=self.__function__,
+                         symmetry=self.__symmetry__,
+                         values=self.values[i],
+                         series=self.series[i])
+
+def fractional_ranks(block):
+    """Row-wise fractional ranks of a (rows x n) block, scaled to [0,1].
+       Tied elements share the mean of their positions, except that the
+       lowest tie group of a row divides by its size plus one; this keeps
+       the exact values of the original loop, and preserves the order."""
+    z = np.array(block, dtype='float', ndmin=2)
+    rows = np.arange(z.shape[0])[:,np.newaxis]
+    n = z.shape[1]
+
+    order = np.argsort(z, axis=1, kind='mergesort')
+    sorts = z[rows,order]
+
+    ends = np.ones(z.shape, dtype='bool')
+    ends[:,:-1] = sorts[:,1:] != sorts[:,:-1]
+    starts = np.ones(z.shape, dtype='bool')
+    starts[:,1:] = ends[:,:-1]
+
+    positions = np.arange(n)
+    first = np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+    last = np.where(ends, positions, n)[:,::-1]
+    last = np.minimum.accumulate(last, axis=1)[:,::-1]
+
+    size = last - first + 1
+    count = size + (first == 0)
+    ranks = np.empty(z.shape, dtype='float')
+    ranks[rows,order] = ((first + last) * size // 2) / count.astype('float')
+    return ranks / float(n - 1)
+
 if __name__ == "__main__":
     print "Defines a class containing a reference series."
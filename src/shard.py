@@ -0,0 +1,92 @@
+#!/usr/bin/epython
+
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import os
+import json
+import shutil
+
+# Each shard's output gets a small JSON manifest next to it, written only
+# once the shard finished, which merging uses to order and check shards.
+
+def parse_shard(astr):
+    """Parses an "i/N" shard spec into (i, N), with 0 <= i < N."""
+    try:
+        i, n = [int(x) for x in astr.split("/")]
+    except ValueError:
+        raise ValueError("shard must look like i/N, e.g. 0/8.")
+    if n < 1 or not 0 <= i < n:
+        raise ValueError("shard i/N needs 0 <= i < N.")
+    return (i, n)
+
+def manifest_path(output):
+    return output + ".shard"
+
+def clear_manifest(output):
+    """Removes a stale manifest before a shard starts writing."""
+    if os.path.exists(manifest_path(output)):
+        os.remove(manifest_path(output))
+
+def write_manifest(output, shard, shards, span, total, rows):
+    """Records a finished shard: its index, the shard count, its (lo, hi)
+       range of the input, the input's total extent, and rows written."""
+    manifest = {
+        "shard": shard,
+        "shards": shards,
+        "range": list(span),
+        "total": total,
+        "rows": rows,
+        }
+    with open(manifest_path(output), "w") as f:
+        json.dump(manifest, f, sort_keys=True)
+
+def order_shards(paths):
+    """Returns shard outputs in input order, with their manifests, after
+       checking that together they cover every range of one input."""
+    shards = []
+    for path in paths:
+        try:
+            with open(manifest_path(path), "r") as f:
+                shards.append((json.load(f), path))
+        except IOError:
+            raise ValueError("%s has no manifest; is the shard finished?"
+                             % path)
+    shards.sort(key=lambda s: s[0]["shard"])
+
+    first = shards[0][0]
+    indices = [m["shard"] for m,_ in shards]
+    if indices != range(first["shards"]):
+        missing = sorted(set(range(first["shards"])) - set(indices))
+        raise ValueError("expected shards 0 to %d, missing %s, given %s."
+                         % (first["shards"] - 1, missing, indices))
+    for (m,path),(n,_) in zip(shards, shards[1:] + [(None, None)]):
+        if m["shards"] != first["shards"] or m["total"] != first["total"]:
+            raise ValueError("%s belongs to another sharded run." % path)
+        if n is not None and m["range"][1] != n["range"][0]:
+            raise ValueError("%s does not end where the next shard starts."
+                             % path)
+    if shards[-1][0]["range"][1] != first["total"]:
+        raise ValueError("shards do not reach the end of the input.")
+    return shards
+
+def merge_shards(paths, foutput):
+    """Writes the header once, then every shard's rows in input order.
+       Returns the number of rows merged."""
+    shards = order_shards(paths)
+    header, rows = None, 0
+    for manifest,path in shards:
+        with open(path, "r") as f:
+            line = f.readline()
+            if header is None:
+                header = line
+                foutput.write(header)
+            elif line != header:
+                raise ValueError("%s has a different header." % path)
+            shutil.copyfileobj(f, foutput)
+        rows += manifest["rows"]
+    return rows
+
+if __name__ == "__main__":
+    print "This module splits runs into shards and merges their outputs."
@@ -6,34 +6,228 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
 import numpy as np
 
+# series length above which scoring switches to sorted_k_score. Measured
+# with bench/threshold_bench.py, the int8 tau path stays faster, row by
+# row and batched, up to about 2200 samples; its pair matrices also grow
+# quadratically, so sorting takes over at 2048.
+SORTED_THRESHOLD = 2048
+
+# memoized pair-index plans, keyed by series length.
+__PLANS__ = {}
+
+# elements of (rows x pairs) temporaries worked on at once, bounding the
+# memory of block scoring to a few of them regardless of the block size.
+CHUNK = 2**20
+
 def k_score(data, ref):
     """Determines concordant / discordant pairwise relationships."""
     q = _tau_vector(data)
     r = _tau_vector(ref)
-    s = np.sum(q * r)
+    s = _dot(q, r)
     return s
 
-def fast_k_score(data, ref_tau):
+def fast_k_score(data, ref_tau, out=None):
     """Uses a memoized version of the tau vector."""
-    q = _tau_vector(data)
+    q = _tau_vector(data, out=out)
     r = ref_tau
-    s = np.sum(q * r)
+    s = _dot(q, r)
     return s
 
-def _tau_vector(series):
-    """Internal comparison vector that gives pairwise relationships."""
+def _dot(q, r):
+    """Score of two sign vectors, accumulated exactly in int32."""
+    return np.float64(np.sum(q * r, dtype='int32'))
+
+def _k_matrix(Q, R):
+    """Exact (series x references) scores of int8 tau matrices. Uses a
+       float32 BLAS product, exact while sums stay below 2**24. References
+       already in that type are used as they are, without a copy."""
+    dtype = 'float32' if Q.shape[1] < 2**24 else 'float64'
+    if R.dtype != dtype:
+        R = R.astype(dtype)
+    K = np.empty(Q.shape[:1] + R.shape[1:], dtype='float')
+    for lo,hi in _chunks(Q.shape[0], Q.shape[1]):
+        K[lo:hi] = np.dot(Q[lo:hi].astype(dtype), R)
+    return K
+
+def _tau_vector(series, dtype='int8', out=None):
+    """Internal comparison vector that gives pairwise relationships.
+       Signs are written into out when argued with the right shape."""
     z = np.array(series, dtype='float')
     n = len(series)
     
     xs,ys = _tril_indices(n)
-    signs = np.sign(z[xs] - z[ys])
-    
-    return signs
+    if out is None or out.shape != xs.shape:
+        out = np.empty(xs.shape, dtype=dtype)
+    out[:] = np.sign(z[xs] - z[ys])
     
+    return out
+
+def _tau_matrix(block, dtype='int8', out=None):
+    """Row-wise tau vectors for a (series x timepoints) block of data."""
+    z = np.array(block, dtype='float', ndmin=2)
+    n = z.shape[1]
+
+    xs,ys = _tril_indices(n)
+    shape = (z.shape[0], len(xs))
+    if out is None or out.shape != shape:
+        out = np.empty(shape, dtype=dtype)
+    for lo,hi in _chunks(shape[0], shape[1]):
+        d = z[lo:hi,xs]
+        np.subtract(d, z[lo:hi,ys], out=d)
+        out[lo:hi] = np.sign(d, out=d)
+
+    return out
+
+def _chunks(rows, width):
+    """(lo, hi) row ranges holding about CHUNK elements of a given width."""
+    step = max(1, CHUNK // max(width, 1))
+    return [(lo, min(lo + step, rows)) for lo in xrange(0, rows, step)]
+
+def query(series, threshold=SORTED_THRESHOLD, out=None):
+    """Scoring handle for a series: its tau vector when short, otherwise
+       the series itself for use with sorted_k_score."""
+    if len(series) > threshold:
+        return np.array(series, dtype='float')
+    return _tau_vector(series, out=out)
+
+def sorted_k_score(data, ref, ref_ties=None):
+    """O(n log n) equivalent of k_score by Knight's method: concordant
+       minus discordant pairs, with tied pairs scoring zero."""
+    x = np.array(data, dtype='float')
+    y = np.array(ref, dtype='float')
+    n = len(x)
+
+    if ref_ties is None:
+        ref_ties = _tied_pairs(y)
+    joint = _tied_pairs(x, y)
+    order = np.lexsort((y, x))
+
+    untied = n * (n - 1) / 2 - _tied_pairs(x) - ref_ties + joint
+    s = untied - 2 * _discordant_pairs(y[order])
+    return float(s)
+
+def sorted_k_matrix(block, refs):
+    """Scores each row of a (series x timepoints) block against each column
+       of a (timepoints x references) matrix of expanded reference series,
+       by Knight's method vectorized over references: rows and references
+       are ranked once, and each (row, reference) pair is a column whose
+       discordant pairs are counted by one shared merge sort. Rows are
+       taken in chunks of about CHUNK elements."""
+    z = np.array(block, dtype='float', ndmin=2)
+    ry = _dense_ranks(np.array(refs, dtype='float', ndmin=2))
+    n, m = ry.shape
+    base = n + 1
+    ref_ties = _run_pairs(np.sort(ry, axis=0))
+    total = n * (n - 1) / 2
+
+    scores = np.zeros((z.shape[0], m), dtype='float')
+    for lo,hi in _chunks(z.shape[0], n * m):
+        rx = _dense_ranks(z[lo:hi].T)
+        ties = _run_pairs(np.sort(rx, axis=0))
+
+        # (timepoints x rows*references), sorted on x, then y within ties.
+        joint = rx[:,:,np.newaxis] * base + ry[:,np.newaxis,:]
+        joint = np.sort(joint.reshape(n, -1), axis=0)
+        untied = (total - ties[:,np.newaxis] - ref_ties
+                  + _run_pairs(joint).reshape(-1, m))
+        swaps = _discordant_matrix(joint % base).reshape(-1, m)
+        scores[lo:hi] = untied - 2 * swaps
+    return scores
+
+def _dense_ranks(A):
+    """Dense ranks (0, 1, ...) of each column of a matrix, as int64."""
+    order = np.argsort(A, axis=0, kind='mergesort')
+    cols = np.arange(A.shape[1])
+    sorts = A[order,cols]
+    steps = np.zeros(A.shape, dtype='int64')
+    steps[1:] = sorts[1:] != sorts[:-1]
+    ranks = np.empty(A.shape, dtype='int64')
+    ranks[order,cols] = np.cumsum(steps, axis=0)
+    return ranks
+
+def _run_pairs(S):
+    """Number of tied pairs in each column of a column-sorted matrix."""
+    idxs = np.arange(S.shape[0])[:,np.newaxis]
+    starts = np.zeros(S.shape, dtype='int64')
+    starts[1:] = np.where(S[1:] != S[:-1], idxs[1:], 0)
+    starts = np.maximum.accumulate(starts, axis=0)
+    return np.sum(idxs - starts, axis=0)
+
+def _discordant_matrix(Y):
+    """Per-column _discordant_pairs of an (n x m) matrix of ranks below
+       n + 1, counted together by flattening columns into merge groups."""
+    n, m = Y.shape
+    base = n + 1
+    y = np.ravel(Y.T).astype('int64')
+    cols = np.repeat(np.arange(m), n)
+    idxs = np.tile(np.arange(n), m)
+
+    swaps = np.zeros(m, dtype='float')
+    width = 1
+    while width < n:
+        block = idxs // width
+        group = cols * n + block // 2
+        right = (block % 2 == 1)
+
+        keys = group * base + y
+        lefts = keys[~right]
+        ends = np.searchsorted(lefts, (group[right] + 1) * base, 'left')
+        above = np.searchsorted(lefts, keys[right], 'right')
+        swaps += np.bincount(cols[right], weights=ends - above, minlength=m)
+
+        y = np.sort(keys) % base
+        width *= 2
+    return swaps
+
+def _tied_pairs(*keys):
+    """Number of pairs tied on every one of the argued keys."""
+    order = np.lexsort(keys)
+    changed = np.zeros(max(len(order) - 1, 0), dtype='bool')
+    for key in keys:
+        k = np.asarray(key)[order]
+        changed |= (k[1:] != k[:-1])
+
+    bounds = np.concatenate(([0], np.flatnonzero(changed) + 1, [len(order)]))
+    runs = np.diff(bounds)
+    return int(np.sum(runs * (runs - 1) / 2))
+
+def _discordant_pairs(y):
+    """Counts pairs i < j with y[i] > y[j] by bottom-up merge sort, each
+       level counting right-block elements exceeded in the left block."""
+    _,y = np.unique(y, return_inverse=True)
+    y = y.astype('int64')
+    n = len(y)
+    base = n + 1
+    idxs = np.arange(n)
+
+    swaps = 0
+    width = 1
+    while width < n:
+        block = idxs // width
+        pair = block // 2
+        right = (block % 2 == 1)
+
+        keys = pair * base + y
+        lefts = keys[~right]
+        ends = np.searchsorted(lefts, (pair[right] + 1) * base, 'left')
+        above = np.searchsorted(lefts, keys[right], 'right')
+        swaps += int(np.sum(ends - above))
+
+        y = np.sort(keys) % base
+        width *= 2
+    return swaps
+
 def _tril_indices(n):
-    """Trivial retrieval of indices."""
-    xs,ys = np.tril_indices(n,k=-1)    
-    return (xs,ys)
+    """Memoized retrieval of indices, stored read-only as int32."""
+    try:
+        return __PLANS__[n]
+    except KeyError:
+        xs,ys = np.tril_indices(n,k=-1)
+        xs, ys = xs.astype('int32'), ys.astype('int32')
+        xs.flags.writeable = False
+        ys.flags.writeable = False
+        __PLANS__[n] = (xs,ys)
+        return (xs,ys)
     
 if __name__ == "__main__":
     print "This is a jtk-cycle statistic calculation module."
@@ -6,6 +6,8 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
 import numpy as np
 import math
+import struct
+import zipfile
 
 def make_times(timepoints, reps=1):
     """Generates an appropriately formatted timereps array.
@@ -41,8 +43,8 @@ def __score_at_percentile__(ser, per):
 
 def erf(x):
     """Dependency-free computation of error function. From Handbook of
-       Mathematical Functions. (7.1.26)"""
-    x = abs(x)
+       Mathematical Functions. (7.1.26) Accepts scalars or arrays."""
+    x = np.absolute(x)
 
     a1 =  0.254829592
     a2 = -0.284496736
@@ -52,9 +54,46 @@ def erf(x):
     p  =  0.3275911
 
     t = 1.0/(1.0 + p*x)
-    y = 1.0 - (((((a5*t + a4)*t) + a3)*t + a2)*t + a1)*t*math.exp(-x*x)
+    y = 1.0 - (((((a5*t + a4)*t) + a3)*t + a2)*t + a1)*t*np.exp(-x*x)
     
-    return y if x >= 0 else 2-y
+    return y
+
+def erfc(x):
+    """Complementary error function, 1 - erf(x), for scalars or arrays."""
+    return 1.0 - erf(x)
+
+def memmap_member(path, name):
+    """Memory-maps an uncompressed .npy member of an .npz archive."""
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name + ".npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError("cannot memory-map compressed member " + name)
+
+    with open(path, "rb") as f:
+        # local file header: fixed 30 bytes, then file name and extra field.
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_size, extra_size = struct.unpack("<HH", header[26:30])
+        f.seek(info.header_offset + 30 + name_size + extra_size)
+
+        # version 2.0 headers, for arrays whose header outgrows 64 KiB,
+        # are only written (and read) by NumPy 1.9 and later.
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        elif hasattr(np.lib.format, "read_array_header_%d_%d" % version):
+            read = getattr(np.lib.format, "read_array_header_%d_%d" % version)
+            shape, fortran, dtype = read(f)
+        else:
+            raise ValueError("cannot read .npy format %d.%d of member %s"
+                             % (version + (name,)))
+        offset = f.tell()
+
+    order = 'F' if fortran else 'C'
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=dtype, order=order)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape,
+                     order=order, offset=offset)
 
 if __name__ == "__main__":
     print "This module includes utility functions for JTK Cycle."